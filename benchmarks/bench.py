@@ -0,0 +1,238 @@
+#!/usr/bin/env python2.7
+
+"""Measures the latency and throughput of UpstartSystem/UpstartJob operations
+against fake_upstart.py, served on a private dbus-daemon, with 10, 1,000, and
+10,000 synthetic jobs (by default). Run from the project root:
+
+    $ python2.7 benchmarks/bench.py --json bench.json
+
+Requires dbus-daemon, python-dbus, and PyGObject, but not Upstart.
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+import argparse
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+
+from os.path import dirname, join
+
+from upstart.batch import BatchController
+from upstart.bus import UpstartBus, set_bus
+from upstart.job import UpstartJob
+from upstart.names import encode_name
+from upstart.system import UpstartSystem
+
+_DEFAULT_SIZES = [10, 1000, 10000]
+_DEFAULT_SAMPLE_SIZE = 500
+
+_BUS_CONFIG = """<!DOCTYPE busconfig PUBLIC
+ "-//freedesktop//DTD D-Bus Bus Configuration 1.0//EN"
+ "http://www.freedesktop.org/standards/dbus/1.0/busconfig.dtd">
+<busconfig>
+  <type>session</type>
+  <listen>unix:dir=%(path)s</listen>
+  <auth>EXTERNAL</auth>
+  <policy context="default">
+    <allow send_destination="*" eavesdrop="true"/>
+    <allow eavesdrop="true"/>
+    <allow own="*"/>
+  </policy>
+</busconfig>
+"""
+
+
+class _FakeUpstart(object):
+    """A private dbus-daemon with fake_upstart.py serving on it."""
+
+    def __init__(self, job_count):
+        self.__job_count = job_count
+
+    def __enter__(self):
+        self.__temp_path = tempfile.mkdtemp(prefix='upstart-bench-')
+
+        config_filepath = join(self.__temp_path, 'bus.conf')
+        with open(config_filepath, 'w') as f:
+            f.write(_BUS_CONFIG % { 'path': self.__temp_path })
+
+        self.__daemon_p = subprocess.Popen(
+                            ['dbus-daemon',
+                             '--config-file=%s' % (config_filepath),
+                             '--print-address=1',
+                             '--nofork'],
+                            stdout=subprocess.PIPE)
+
+        self.address = self.__daemon_p.stdout.readline().strip()
+
+        fake_filepath = join(dirname(__file__), 'fake_upstart.py')
+        self.__fake_p = subprocess.Popen(
+                            [sys.executable,
+                             fake_filepath,
+                             '--address', self.address,
+                             '--jobs', str(self.__job_count)],
+                            stdout=subprocess.PIPE)
+
+        if self.__fake_p.stdout.readline().strip() != 'ready':
+            raise EnvironmentError("The fake Upstart didn't start.")
+
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        for p in (self.__fake_p, self.__daemon_p):
+            p.terminate()
+            p.wait()
+
+        shutil.rmtree(self.__temp_path)
+
+
+def _summarize(durations, ops_per_call=1):
+    """Summarize the durations of the calls of one benchmark."""
+
+    durations = sorted(durations)
+    total_s = sum(durations)
+    count = len(durations)
+
+    return { 'calls': count,
+             'total_s': total_s,
+             'mean_ms': total_s / count * 1000.0,
+             'p50_ms': durations[count // 2] * 1000.0,
+             'p99_ms': durations[min(count - 1, int(count * 0.99))] * 1000.0,
+             'ops_per_s': (count * ops_per_call) / total_s
+                          if total_s > 0
+                          else None }
+
+
+def _time_calls(callables):
+    durations = []
+    for c in callables:
+        started_at = time.time()
+        c()
+        durations.append(time.time() - started_at)
+
+    return durations
+
+
+def _run_size(job_count, sample_size, repeat):
+    results = {}
+
+    with _FakeUpstart(job_count) as fake:
+        bus = UpstartBus(address=fake.address)
+        set_bus(bus)
+
+        s = UpstartSystem()
+
+        # The fake names its jobs "job-NNNNN". Even-numbered single-instance
+        # jobs start out running, and odd-numbered ones stopped.
+        sample = range(min(job_count, sample_size))
+        running = ['job-%05d' % (i)
+                   for i
+                   in sample
+                   if i % 2 == 0 and i % 10 != 9]
+
+        stopped = ['job-%05d' % (i)
+                   for i
+                   in sample
+                   if i % 2 == 1 and i % 10 != 9]
+
+        results['enumerate'] = _summarize(
+            _time_calls([lambda: list(s.get_all_jobs())] * repeat),
+            ops_per_call=job_count)
+
+        # UpstartJob takes escaped names; BatchController escapes its own.
+        jobs = [UpstartJob(encode_name(job_name)) for job_name in running]
+        results['status_serial'] = _summarize(
+            _time_calls([j.get_status for j in jobs]))
+
+        results['status_serial_native'] = _summarize(
+            _time_calls([lambda j=j: j.get_status(native=True)
+                         for j
+                         in jobs]))
+
+        results['status_bulk'] = _summarize(
+            _time_calls([s.get_all_job_statuses] * repeat),
+            ops_per_call=job_count)
+
+        results['status_bulk_native'] = _summarize(
+            _time_calls([lambda: s.get_all_job_statuses(native=True)] *
+                        repeat),
+            ops_per_call=job_count)
+
+        jobs = [UpstartJob(encode_name(job_name)) for job_name in stopped]
+        results['start_serial'] = _summarize(
+            _time_calls([j.start for j in jobs]))
+
+        results['stop_serial'] = _summarize(
+            _time_calls([j.stop for j in jobs]))
+
+        bc = BatchController(concurrency=64)
+        results['start_batch'] = _summarize(
+            _time_calls([lambda: bc.start(stopped)]),
+            ops_per_call=len(stopped))
+
+        results['stop_batch'] = _summarize(
+            _time_calls([lambda: bc.stop(stopped)]),
+            ops_per_call=len(stopped))
+
+        results['emit_serial'] = _summarize(
+            _time_calls([lambda: s.emit('bench', { 'N': 1 })] * sample_size))
+
+        events = [('bench', { 'N': i }) for i in range(sample_size)]
+        results['emit_many'] = _summarize(
+            _time_calls([lambda: s.emit_many(events, max_in_flight=256)]),
+            ops_per_call=sample_size)
+
+        set_bus(None)
+        bus.close()
+
+    return results
+
+
+def _print_results(job_count, results):
+    print("%d jobs" % (job_count))
+    print("%-22s %8s %10s %10s %10s %12s" %
+          ('benchmark', 'calls', 'mean ms', 'p50 ms', 'p99 ms', 'ops/s'))
+
+    for name in sorted(results.keys()):
+        r = results[name]
+        print("%-22s %8d %10.3f %10.3f %10.3f %12.1f" %
+              (name, r['calls'], r['mean_ms'], r['p50_ms'], r['p99_ms'],
+               r['ops_per_s'] or 0))
+
+    print('')
+
+
+def _main():
+    description = "Benchmark the Upstart library against a fake Upstart."
+    parser = argparse.ArgumentParser(description=description)
+
+    parser.add_argument('-s', '--sizes',
+                        help="Comma-separated numbers of synthetic jobs",
+                        default=','.join([str(n) for n in _DEFAULT_SIZES]))
+    parser.add_argument('-n', '--sample-size', type=int,
+                        default=_DEFAULT_SAMPLE_SIZE,
+                        help="Number of jobs/events for the per-call "
+                             "benchmarks")
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help="Repetitions of the whole-system benchmarks")
+    parser.add_argument('-j', '--json',
+                        help="Also write the results to this file")
+
+    args = parser.parse_args()
+
+    all_results = {}
+    for job_count in [int(n) for n in args.sizes.split(',')]:
+        results = _run_size(job_count, args.sample_size, args.repeat)
+        _print_results(job_count, results)
+
+        all_results[str(job_count)] = results
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(all_results, f, indent=4, sort_keys=True)
+
+if __name__ == '__main__':
+    _main()
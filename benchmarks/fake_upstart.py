@@ -0,0 +1,368 @@
+#!/usr/bin/env python2.7
+
+"""A stand-in for Upstart's D-Bus API (com.ubuntu.Upstart0_6 and its Job and
+Instance interfaces), with synthetic jobs, for benchmarking without a real
+Upstart as PID 1. Every job and instance is served by one fallback object.
+
+Run by bench.py, which starts it on a private dbus-daemon.
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+import argparse
+import itertools
+
+import dbus
+import dbus.bus
+import dbus.service
+
+from dbus.mainloop.glib import DBusGMainLoop
+
+try:
+    from gi.repository import GLib as glib
+except ImportError:
+    import gobject as glib
+
+from upstart.bus import UPSTART_BUS_NAME, UPSTART_OBJECT_PATH, \
+                        UPSTART_JOBS_PATH, UPSTART_INTERFACE, JOB_INTERFACE, \
+                        INSTANCE_INTERFACE, PROPERTIES_INTERFACE
+from upstart.names import encode_name
+
+_ERROR_PREFIX = 'com.ubuntu.Upstart0_6.Error.'
+
+# Every tenth job is a multi-instance job ("instance $N").
+_MULTI_INSTANCE_EVERY = 10
+
+
+class UpstartError(dbus.DBusException):
+    def __init__(self, name, message):
+        super(UpstartError, self).__init__(message)
+        self._dbus_error_name = _ERROR_PREFIX + name
+
+
+def _processes(pid):
+    return dbus.Array([dbus.Struct(('main', pid), signature='si')],
+                      signature='(si)')
+
+
+class _Jobs(object):
+    def __init__(self, job_count):
+        self.pids = itertools.count(1000)
+        self.jobs = {}
+
+        for i in range(job_count):
+            name = ('job-%05d' % (i))
+            element = encode_name(name)
+
+            if i % 3 == 0:
+                start_on = [['runlevel', '[2345]']]
+            else:
+                # Build a few levels of dependencies.
+                start_on = [['started', 'job-%05d' % (i // 3)]]
+
+            job = { 'name': name,
+                    'instance_var': ('N'
+                                     if i % _MULTI_INSTANCE_EVERY == 9
+                                     else None),
+                    'start_on': start_on,
+                    'stop_on': [['runlevel', '[!2345]']],
+                    'instances': {} }
+
+            # Half of the single-instance jobs start out running.
+            if job['instance_var'] is None and i % 2 == 0:
+                job['instances']['_'] = self.new_instance('')
+
+            self.jobs[element] = job
+
+    def new_instance(self, name):
+        return { 'name': name,
+                 'goal': 'start',
+                 'state': 'running',
+                 'processes': _processes(next(self.pids)) }
+
+
+class FakeUpstart(dbus.service.Object):
+    def __init__(self, connection, jobs):
+        super(FakeUpstart, self).__init__(connection, UPSTART_OBJECT_PATH)
+
+        self.__jobs = jobs
+        self.__properties = { 'version': 'init (upstart 1.12.1-fake)',
+                              'log_priority': 'message' }
+
+        self.events_emitted = 0
+        self.reloads = 0
+
+    @dbus.service.method(UPSTART_INTERFACE, in_signature='',
+                         out_signature='ao')
+    def GetAllJobs(self):
+        return ['%s/%s' % (UPSTART_JOBS_PATH, element)
+                for element
+                in self.__jobs.jobs.keys()]
+
+    @dbus.service.method(UPSTART_INTERFACE, in_signature='s',
+                         out_signature='o')
+    def GetJobByName(self, name):
+        element = encode_name(name)
+        if element not in self.__jobs.jobs:
+            raise UpstartError('UnknownJob', "Unknown job: %s" % (name))
+
+        return ('%s/%s' % (UPSTART_JOBS_PATH, element))
+
+    @dbus.service.method(UPSTART_INTERFACE, in_signature='sasb',
+                         out_signature='')
+    def EmitEvent(self, name, env, wait):
+        self.events_emitted += 1
+
+    @dbus.service.method(UPSTART_INTERFACE, in_signature='',
+                         out_signature='')
+    def ReloadConfiguration(self):
+        self.reloads += 1
+
+    @dbus.service.signal(UPSTART_INTERFACE, signature='o')
+    def JobAdded(self, job_path):
+        pass
+
+    @dbus.service.signal(UPSTART_INTERFACE, signature='o')
+    def JobRemoved(self, job_path):
+        pass
+
+    @dbus.service.method(PROPERTIES_INTERFACE, in_signature='ss',
+                         out_signature='v')
+    def Get(self, interface_name, property_name):
+        return self.__properties[property_name]
+
+    @dbus.service.method(PROPERTIES_INTERFACE, in_signature='s',
+                         out_signature='a{sv}')
+    def GetAll(self, interface_name):
+        return self.__properties
+
+    @dbus.service.method(PROPERTIES_INTERFACE, in_signature='ssv',
+                         out_signature='')
+    def Set(self, interface_name, property_name, value):
+        self.__properties[property_name] = value
+
+
+class _FakeInstances(dbus.service.FallbackObject):
+    """Serves the Instance interface at /jobs/<job>/<instance>. Its methods 
+    share their names with the Job interface's, which FakeJobs overrides; 
+    dbus-python dispatches on the interface through the class hierarchy.
+    """
+
+    def __init__(self, connection, jobs):
+        super(_FakeInstances, self).__init__(connection, UPSTART_JOBS_PATH)
+        self._jobs = jobs
+
+    def _resolve(self, rel_path):
+        parts = rel_path.strip('/').split('/')
+
+        try:
+            job = self._jobs.jobs[parts[0]]
+        except KeyError:
+            raise UpstartError('UnknownJob', "Unknown job: %s" % (parts[0]))
+
+        if len(parts) == 1:
+            return (parts[0], job, None, None)
+
+        try:
+            instance = job['instances'][parts[1]]
+        except KeyError:
+            raise UpstartError('UnknownInstance', 
+                               "Unknown instance: %s" % (rel_path))
+
+        return (parts[0], job, parts[1], instance)
+
+    def _start(self, element, job, instance_name):
+        instance_element = encode_name(instance_name)
+        if instance_element in job['instances']:
+            raise UpstartError('AlreadyStarted', 
+                               "Job is already running: %s" % (job['name']))
+
+        job['instances'][instance_element] = \
+            self._jobs.new_instance(instance_name)
+
+        rel_path = ('/%s/%s' % (element, instance_element))
+        instance_path = (UPSTART_JOBS_PATH + rel_path)
+
+        self.InstanceAdded(instance_path, rel_path=('/' + element))
+        self.GoalChanged('start', rel_path=rel_path)
+        self.StateChanged('running', rel_path=rel_path)
+
+        return instance_path
+
+    def _stop(self, element, job, instance_element):
+        if job['instances'].pop(instance_element, None) is None:
+            raise UpstartError('UnknownInstance', 
+                               "Job has already been stopped: %s" % 
+                               (job['name']))
+
+        rel_path = ('/%s/%s' % (element, instance_element))
+
+        self.GoalChanged('stop', rel_path=rel_path)
+        self.StateChanged('waiting', rel_path=rel_path)
+        self.InstanceRemoved(UPSTART_JOBS_PATH + rel_path, 
+                             rel_path=('/' + element))
+
+    @dbus.service.method(INSTANCE_INTERFACE, in_signature='b', 
+                         out_signature='', rel_path_keyword='rel_path')
+    def Start(self, wait, rel_path=None):
+        (element, job, instance_element, instance) = self._resolve(rel_path)
+
+        if instance['goal'] == 'start':
+            raise UpstartError('AlreadyStarted', 
+                               "Job is already running: %s" % (job['name']))
+
+    @dbus.service.method(INSTANCE_INTERFACE, in_signature='b', 
+                         out_signature='', rel_path_keyword='rel_path')
+    def Stop(self, wait, rel_path=None):
+        (element, job, instance_element, _) = self._resolve(rel_path)
+        self._stop(element, job, instance_element)
+
+    @dbus.service.method(INSTANCE_INTERFACE, in_signature='b', 
+                         out_signature='', rel_path_keyword='rel_path')
+    def Restart(self, wait, rel_path=None):
+        (element, job, instance_element, instance) = self._resolve(rel_path)
+
+        instance['processes'] = _processes(next(self._jobs.pids))
+        self.StateChanged('running', rel_path=rel_path)
+
+    @dbus.service.signal(INSTANCE_INTERFACE, signature='s', 
+                         rel_path_keyword='rel_path')
+    def GoalChanged(self, goal, rel_path=None):
+        pass
+
+    @dbus.service.signal(INSTANCE_INTERFACE, signature='s', 
+                         rel_path_keyword='rel_path')
+    def StateChanged(self, state, rel_path=None):
+        pass
+
+
+class FakeJobs(_FakeInstances):
+    """Serves the Job interface at /jobs/<job>, and the properties of both 
+    jobs and instances.
+    """
+
+    def __get_instance_name(self, job, env):
+        if job['instance_var'] is None:
+            return ''
+
+        prefix = job['instance_var'] + '='
+        for pair in env:
+            if pair.startswith(prefix) is True:
+                return pair[len(prefix):]
+
+        return ''
+
+    @dbus.service.method(JOB_INTERFACE, in_signature='asb', 
+                         out_signature='o', rel_path_keyword='rel_path')
+    def Start(self, env, wait, rel_path=None):
+        (element, job, _, _) = self._resolve(rel_path)
+        return self._start(element, job, self.__get_instance_name(job, env))
+
+    @dbus.service.method(JOB_INTERFACE, in_signature='asb', 
+                         out_signature='', rel_path_keyword='rel_path')
+    def Stop(self, env, wait, rel_path=None):
+        (element, job, _, _) = self._resolve(rel_path)
+        instance_name = self.__get_instance_name(job, env)
+        self._stop(element, job, encode_name(instance_name))
+
+    @dbus.service.method(JOB_INTERFACE, in_signature='asb', 
+                         out_signature='o', rel_path_keyword='rel_path')
+    def Restart(self, env, wait, rel_path=None):
+        (element, job, _, _) = self._resolve(rel_path)
+        instance_name = self.__get_instance_name(job, env)
+        self._stop(element, job, encode_name(instance_name))
+        return self._start(element, job, instance_name)
+
+    @dbus.service.method(JOB_INTERFACE, in_signature='as', 
+                         out_signature='o', rel_path_keyword='rel_path')
+    def GetInstance(self, env, rel_path=None):
+        (element, job, _, _) = self._resolve(rel_path)
+        instance_name = self.__get_instance_name(job, env)
+        return self.GetInstanceByName(instance_name, rel_path=rel_path)
+
+    @dbus.service.method(JOB_INTERFACE, in_signature='s', 
+                         out_signature='o', rel_path_keyword='rel_path')
+    def GetInstanceByName(self, instance_name, rel_path=None):
+        (element, job, _, _) = self._resolve(rel_path)
+        instance_element = encode_name(instance_name)
+
+        if instance_element not in job['instances']:
+            raise UpstartError('UnknownInstance', 
+                               "Unknown instance: %s" % (instance_name))
+
+        return ('%s/%s/%s' % (UPSTART_JOBS_PATH, element, instance_element))
+
+    @dbus.service.method(JOB_INTERFACE, in_signature='', 
+                         out_signature='ao', rel_path_keyword='rel_path')
+    def GetAllInstances(self, rel_path=None):
+        (element, job, _, _) = self._resolve(rel_path)
+
+        return ['%s/%s/%s' % (UPSTART_JOBS_PATH, element, instance_element) 
+                for instance_element 
+                in job['instances'].keys()]
+
+    @dbus.service.signal(JOB_INTERFACE, signature='o', 
+                         rel_path_keyword='rel_path')
+    def InstanceAdded(self, instance_path, rel_path=None):
+        pass
+
+    @dbus.service.signal(JOB_INTERFACE, signature='o', 
+                         rel_path_keyword='rel_path')
+    def InstanceRemoved(self, instance_path, rel_path=None):
+        pass
+
+    def __get_properties(self, rel_path):
+        (element, job, instance_element, instance) = self._resolve(rel_path)
+
+        if instance is not None:
+            return instance
+
+        return { 'name': job['name'], 
+                 'description': 'Synthetic job %s' % (job['name']), 
+                 'author': 'benchmark', 
+                 'version': '', 
+                 'usage': '', 
+                 'start_on': dbus.Array(job['start_on'], signature='as'), 
+                 'stop_on': dbus.Array(job['stop_on'], signature='as') }
+
+    @dbus.service.method(PROPERTIES_INTERFACE, in_signature='ss', 
+                         out_signature='v', rel_path_keyword='rel_path')
+    def Get(self, interface_name, property_name, rel_path=None):
+        return self.__get_properties(rel_path)[property_name]
+
+    @dbus.service.method(PROPERTIES_INTERFACE, in_signature='s', 
+                         out_signature='a{sv}', rel_path_keyword='rel_path')
+    def GetAll(self, interface_name, rel_path=None):
+        return self.__get_properties(rel_path)
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="A fake Upstart D-Bus "
+                                                 "service.")
+
+    parser.add_argument('-a', '--address', required=True,
+                        help="Address of the bus to serve on")
+    parser.add_argument('-j', '--jobs', type=int, default=1000,
+                        help="Number of synthetic jobs")
+
+    args = parser.parse_args()
+
+    connection = dbus.bus.BusConnection(args.address,
+                                        mainloop=DBusGMainLoop())
+
+    jobs = _Jobs(args.jobs)
+
+    upstart = FakeUpstart(connection, jobs)
+    jobs_o = FakeJobs(connection, jobs)
+
+    name = dbus.service.BusName(UPSTART_BUS_NAME, connection)
+
+    # Tell the parent that we're serving.
+    sys.stdout.write("ready\n")
+    sys.stdout.flush()
+
+    glib.MainLoop().run()
+
+if __name__ == '__main__':
+    _main()
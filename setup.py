@@ -28,6 +28,8 @@ setup(name='upstart',
       install_requires=[],
       entry_points="",
       scripts=['scripts/upstart-create',
-               'scripts/upstart-reload'],
+               'scripts/upstart-reload',
+               'scripts/upstart-status',
+               'scripts/upstart-top'],
 #      cmdclass=versioneer.get_cmdclass(),
 )
@@ -71,7 +71,490 @@ while 1:
     stdout.write(job_raw)
     print("================")
 
+def test_render_cache():
+    from upstart.job_builder import JobBuilder, render_many
+
+    jb = JobBuilder()
+    jb.description('Test description').\
+       run('/usr/bin/my_daemon')
+
+    rendered = str(jb)
+    assert str(jb) is rendered
+
+    jb.respawn()
+    assert str(jb) is not rendered
+    assert str(jb) == rendered + "respawn \n"
+
+    print(render_many([jb, jb]))
+
+def test_template():
+    from upstart.job_builder import JobBuilder, JobBashScript
+    from upstart.job_template import JobTemplate
+
+    jb = JobBuilder()
+    jb.description('Worker {{shard}}').\
+       run('/usr/bin/worker --port {{port}}')
+
+    t = JobTemplate(jb)
+    assert t.variables == frozenset(['shard', 'port'])
+
+    rendered = t.render({ 'shard': 'a"b', 'port': 8000 })
+    assert rendered == "description \"Worker a\\\"b\"\n" \
+                       "exec /usr/bin/worker --port 8000\n"
+
+    print(rendered)
+
+    # Shell text is inserted exactly as given, even within double-quotes.
+    jb = JobBuilder()
+    jb.author('{{owner}}').\
+       run('/bin/sh -c "echo {{y}}"').\
+       pre_start(JobBashScript('echo "{{y}}"\nversion "{{y}}"'))
+
+    rendered = JobTemplate(jb).render({ 'owner': "it's", 'y': "it's" })
+
+    assert "author \"it\\'s\"\n" in rendered
+    assert "exec /bin/sh -c \"echo it's\"\n" in rendered
+    assert "echo \"it's\"\nversion \"it's\"\n" in rendered
+
+def test_parser():
+    from cStringIO import StringIO
+    from upstart.job_builder import JobBuilder, JobBashScript, \
+                                    JobPythonScript
+    from upstart.job_parser import parse
+
+    s = JobPythonScript("""
+import time
+while 1:
+    time.sleep(1)
+""")
+
+    jb = JobBuilder()
+    jb.description('Test "description" # not a comment').\
+       set_raw('start on', '(local-filesystems and net-device-up IFACE!=lo)').\
+       stop_on_runlevel().\
+       env('A', '1').\
+       env('B', '2').\
+       respawn().\
+       run(s)
+
+    rendered = str(jb)
+    assert str(parse(StringIO(rendered))) == rendered
+
+    # Bash scripts are followed by a blank line.
+    jb = JobBuilder()
+    jb.pre_start(JobBashScript("echo starting\n")).\
+       run(JobBashScript("exec /usr/bin/my_daemon\n")).\
+       respawn()
+
+    rendered = str(jb)
+    assert str(parse(StringIO(rendered))) == rendered
+
+    # Only event expressions continue on an open parenthesis.
+    jb = parse(StringIO("exec /usr/bin/foo :-(\n"
+                        "env FACE=(\n"
+                        "start on (a\n"
+                        "          and b)\n"))
+
+    assert jb.get_stanzas() == [('exec', ['/usr/bin/foo :-(']),
+                                ('env', ['FACE=(']),
+                                ('start on', ['(a and b)'])]
+
+    print(parse(StringIO("""
+# A comment.
+start on (local-filesystems
+          and net-device-up)
+exec /usr/bin/my_daemon # Another comment.
+""")))
+
+def test_parse_cache():
+    import shutil
+    import tempfile
+    from os.path import join
+    from upstart.job_parser import JobParseCache, load_directory
+
+    path = tempfile.mkdtemp()
+
+    try:
+        # Job files needn't be UTF-8.
+        rendered = 'description "caf\xe9"\nexec /usr/bin/my_daemon\n'
+        open(join(path, 'a.conf'), 'w').write(rendered)
+
+        cache_filepath = join(path, 'jobs.json')
+
+        c = JobParseCache(cache_filepath)
+        load_directory(path, cache=c)
+        c.save()
+
+        jobs = load_directory(path, cache=JobParseCache(cache_filepath))
+        assert str(jobs['a']) == rendered
+
+        open(cache_filepath, 'w').write('{"version": 1, "entries": [')
+        jobs = load_directory(path, cache=JobParseCache(cache_filepath))
+        assert str(jobs['a']) == rendered
+    finally:
+        shutil.rmtree(path)
+
+def test_writer():
+    import os
+    import shutil
+    import tempfile
+    from os.path import join
+    from upstart.job_builder import JobBuilder
+    from upstart.job_writer import AtomicJobWriter
+
+    path = tempfile.mkdtemp()
+
+    jb = JobBuilder()
+    jb.run('/usr/bin/my_daemon')
+
+    try:
+        with AtomicJobWriter() as w:
+            w.write(join(path, 'a.conf'), jb)
+            w.write(join(path, 'b.conf'), 'exec /bin/true\n')
+
+            # Nothing is in place until the commit.
+            assert all(f.endswith('.tmp') for f in os.listdir(path))
+
+        assert sorted(os.listdir(path)) == ['a.conf', 'b.conf']
+        assert open(join(path, 'a.conf')).read() == str(jb)
+
+        try:
+            with AtomicJobWriter() as w:
+                w.write(join(path, 'c.conf'), jb)
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+
+        assert sorted(os.listdir(path)) == ['a.conf', 'b.conf']
+    finally:
+        shutil.rmtree(path)
+
+def test_job_set():
+    import os
+    import shutil
+    import tempfile
+    from os.path import join
+    from upstart.job_builder import JobBuilder
+    from upstart.job_set import JobSet
+
+    path = tempfile.mkdtemp()
+
+    def build(i):
+        jb = JobBuilder()
+        jb.run('/usr/bin/worker %d' % (i))
+
+        return jb
+
+    try:
+        open(join(path, 'other.conf'), 'w').write('exec /bin/true\n')
+
+        js = JobSet(path, prune_pattern='^worker-')
+        for i in range(3):
+            js.add('worker-%d' % (i), build(i))
+
+        plan = js.apply(reload=False)
+        assert sorted(plan.to_write.keys()) == \
+                ['worker-0', 'worker-1', 'worker-2']
+        assert plan.reloaded is False
+        assert open(join(path, 'worker-1.conf')).read() == str(build(1))
+
+        plan = JobSet(path, prune_pattern='^worker-') \
+                .add('worker-0', build(0)) \
+                .add('worker-1', build(10)) \
+                .apply(reload=False)
+
+        assert plan.unchanged == ['worker-0']
+        assert plan.to_write.keys() == ['worker-1']
+        assert plan.to_remove == ['worker-2']
+        assert sorted(os.listdir(path)) == \
+                ['other.conf', 'worker-0.conf', 'worker-1.conf']
+        assert open(join(path, 'worker-1.conf')).read() == str(build(10))
+
+        plan = JobSet(path, prune_pattern='^worker-') \
+                .add('worker-0', build(0)) \
+                .add('worker-1', build(10)) \
+                .apply(reload=False)
+
+        assert plan.is_changed is False
+    finally:
+        shutil.rmtree(path)
+
+def test_spec():
+    import cPickle
+    from upstart.job_builder import JobBuilder
+
+    def build(port):
+        jb = JobBuilder()
+        jb.description('Worker').\
+           env('PORT', port).\
+           run('/usr/bin/worker')
+
+        return jb
+
+    spec = build('8000').to_spec()
+
+    assert spec == build('8000').to_spec()
+    assert spec != build('8001').to_spec()
+    assert len(set([spec, build('8000').to_spec()])) == 1
+    assert str(spec) == str(build('8000'))
+    assert spec.get('exec') == ('/usr/bin/worker',)
+    assert cPickle.loads(cPickle.dumps(spec, 2)) == spec
+    assert str(JobBuilder.from_stanzas(spec.stanzas)) == str(spec)
+
+    # Values are interned, and specs decoded together share their stanzas.
+    assert spec.get('exec')[0] is build('8001').to_spec().get('exec')[0]
+
+    from upstart.job_codec import dumps_binary, loads_binary
+
+    specs = loads_binary(dumps_binary({ 'a': spec, 'b': spec }), 
+                         as_specs=True)
+
+    assert specs['a'].stanzas is specs['b'].stanzas
+
+    print(repr(spec))
+
+def test_events():
+    from upstart.events import EventIndex, parse_expression, parse_condition
+
+    e = parse_expression('(local-filesystems and net-device-up IFACE!=lo) '
+                         'or runlevel [2345]')
+
+    assert e.evaluate([('runlevel', ['RUNLEVEL=2', 'PREVLEVEL=N'])]) is True
+    assert e.evaluate([('local-filesystems', None),
+                       ('net-device-up', { 'IFACE': 'lo' })]) is False
+    assert str(parse_expression(str(e))) == str(e)
+
+    c = parse_condition([['local-filesystems'], 
+                         ['net-device-up', 'IFACE!=lo'], 
+                         ['/AND'], 
+                         ['runlevel', '[2345]'], 
+                         ['/OR']])
+    assert str(c) == str(e)
+
+    i = EventIndex()
+    i.add('a', e, 'runlevel [!2345]')
+    i.add('b', 'started a')
+
+    assert i.triggered('started', { 'JOB': 'a' }) == [('b', 'start')]
+    assert i.triggered('started', { 'JOB': 'a', 'INSTANCE': '' }) == \
+           [('b', 'start')]
+    assert i.triggered('runlevel', { 'RUNLEVEL': '2', 'PREVLEVEL': 'N' }) == \
+           [('a', 'start')]
+    assert i.triggered('runlevel', ['RUNLEVEL=1']) == [('a', 'stop')]
+    assert i.triggered('net-device-up', { 'IFACE': 'eth0' }) == []
+    assert i.matching('net-device-up', { 'IFACE': 'eth0' }) == \
+           [('a', 'start')]
+
+    # Re-adding a job whose conditions share an event.
+    i.add('c', 'runlevel [2345]', 'runlevel [!2345]')
+    i.add('c', 'runlevel [2345]', 'runlevel [!2345]')
+    assert i.remove('c') is True
+    assert i.matching('runlevel', ['RUNLEVEL=1']) == [('a', 'stop')]
+
+    print(repr(e))
+
+def test_graph():
+    from upstart.job_graph import JobGraph
+
+    g = JobGraph()
+    g.add('db', 'runlevel [2345]').\
+      add('cache', 'runlevel [2345]').\
+      add('app', 'started db and started cache').\
+      add('web', 'started app').\
+      add('log', 'starting db')
+
+    assert g.get_waves() == [['cache', 'log'], ['db'], ['app'], ['web']]
+    assert g.get_critical_path({ 'db': 5 }) == \
+           (8, ['log', 'db', 'app', 'web'])
+
+    g.add('db', 'started web')
+    assert g.get_cycles() == [['app', 'db', 'web']]
+
+    print(g.get_cycles())
+
+def test_streamed_script():
+    from cStringIO import StringIO
+    from upstart.job_builder import JobBuilder, JobBashScript
+
+    jb = JobBuilder()
+    jb.run(JobBashScript.from_file(StringIO("\n  echo streamed")))
+
+    s = StringIO()
+    jb.write(s)
+
+    assert s.getvalue() == "script \necho streamed\nend script\n\n"
+    assert str(jb) == s.getvalue()
+
+    print(s.getvalue())
+
+def test_codec():
+    from upstart.job_builder import JobBuilder
+    from upstart.job_codec import dumps_binary, loads_binary, dumps_json, \
+                                  loads_json
+
+    jb = JobBuilder()
+    jb.description('Worker').\
+       env('PORT', '8000').\
+       env('SHARD', '1').\
+       run('/usr/bin/worker')
+
+    jobs = { 'worker-1': jb, 'worker-2': jb.to_spec() }
+
+    for (dumps, loads) in ((dumps_binary, loads_binary), 
+                           (dumps_json, loads_json)):
+        loaded = loads(dumps(jobs))
+        assert sorted(loaded.keys()) == ['worker-1', 'worker-2']
+        assert str(loaded['worker-2']) == str(jb)
+
+        assert loads(dumps(jobs), as_specs=True)['worker-1'] == jb.to_spec()
+
+    print(dumps_json(jobs))
+
+def test_sampler():
+    import os
+    from upstart.sampler import JobSampler
+
+    s = JobSampler(history_size=3, use_numpy=False)
+    for i in range(5):
+        s.sample({ 'me': [os.getpid()], 'gone': [] }, now=float(i))
+
+    assert s.get_history('me')['time'] == [2.0, 3.0, 4.0]
+
+    rates = s.summarize()
+    assert rates['me']['rss_bytes'] > 0
+    assert rates['gone']['cpu_percent'] == 0.0
+
+    print(rates['me'])
+
+    try:
+        import numpy
+    except ImportError:
+        return
+
+    n = JobSampler(history_size=3, use_numpy=True)
+    for i in range(5):
+        n.sample({ 'me': [os.getpid()], 'gone': [] }, now=float(i))
+
+    assert n.get_history('me')['time'].tolist() == [2.0, 3.0, 4.0]
+
+    numpy_rates = n.summarize()
+    assert numpy_rates['gone'] == rates['gone']
+    assert sorted(numpy_rates['me'].keys()) == sorted(rates['me'].keys())
+    assert n.get_rates('me', window=1)['cpu_percent'] is None
+
+def test_reload():
+    import shutil
+    import socket
+    import tempfile
+    import threading
+    import time
+    from os.path import join
+    from upstart.reload import ReloadCoordinator, request_reload
+
+    path = tempfile.mkdtemp()
+    socket_path = join(path, 'reload.sock')
+
+    reloads = []
+    c = ReloadCoordinator(socket_path=socket_path, window_s=0.5,
+                          reload_=lambda: reloads.append(time.time()))
+
+    server = threading.Thread(target=c.serve_forever)
+    server.start()
+
+    try:
+        # Don't let a request fall back to a real reload before the 
+        # coordinator is listening.
+        while True:
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socket_path)
+                break
+            except socket.error:
+                time.sleep(0.01)
+            finally:
+                probe.close()
+
+        merged = []
+        clients = [threading.Thread(
+                    target=lambda: merged.append(
+                                    request_reload(socket_path=socket_path)))
+                   for _
+                   in range(5)]
+
+        for client in clients:
+            client.start()
+
+        for client in clients:
+            client.join()
+
+        assert len(reloads) == 1
+        assert merged == [5] * 5
+        assert (c.reloads, c.requests) == (1, 5)
+    finally:
+        c.stop()
+        server.join()
+        shutil.rmtree(path)
+
+def test_create_manifest():
+    import shutil
+    import subprocess
+    import tempfile
+    from os.path import join
+
+    path = tempfile.mkdtemp()
+
+    def create(lines):
+        manifest_filepath = join(path, 'jobs.jsonl')
+        with open(manifest_filepath, 'w') as f:
+            f.write(''.join([line + "\n" for line in lines]))
+
+        p = subprocess.Popen([sys.executable, 'scripts/upstart-create', 
+                              '-m', manifest_filepath, '-j'], 
+                             cwd='..', 
+                             stdout=subprocess.PIPE, 
+                             stderr=subprocess.STDOUT)
+
+        output = p.communicate()[0]
+        return (p.returncode, output)
+
+    try:
+        (code, output) = create([
+            '{"name": "worker-1", "command": "/bin/true"}',
+            '{"name": "worker-2", "command": "/bin/true", "expect": "fork"}'])
+
+        assert code == 0
+        assert output.startswith("# worker-1.conf\nexec /bin/true\n")
+        assert "\n# worker-2.conf\nexec /bin/true\n" in output
+        assert "expect fork" in output
+
+        (code, output) = create([
+            '{"name": "worker-1", "command": "/bin/true"}',
+            '{"name": "worker-1", "command": "/bin/true"}',
+            '{"name": "worker-2", "command": "/bin/true", "expect": "forks"}',
+            '[1, 2]'])
+
+        assert code == 1
+        assert output.splitlines() == [
+            "Record 2: Job is listed more than once: worker-1",
+            "Record 3: Expect should be one of fork, daemon, stop: forks",
+            "Record 4: Record is not an object: [1, 2]"]
+    finally:
+        shutil.rmtree(path)
 
 #test_system()
+test_render_cache()
+test_template()
+test_parser()
+test_parse_cache()
+test_writer()
+test_job_set()
+test_spec()
+test_events()
+test_graph()
+test_streamed_script()
+test_codec()
+test_sampler()
+test_reload()
+test_create_manifest()
 test_jobs()
 
@@ -0,0 +1,196 @@
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from upstart.bus import UpstartBus, start_main_loop_thread, \
+                        UPSTART_OBJECT_PATH, UPSTART_JOBS_PATH, \
+                        UPSTART_INTERFACE, JOB_INTERFACE, PROPERTIES_INTERFACE
+from upstart.system import get_env_list
+
+_default_bus = None
+
+
+def _get_async_bus():
+    global _default_bus
+
+    if _default_bus is None:
+        _default_bus = UpstartBus()
+
+    return _default_bus
+
+
+class _AsyncCaller(object):
+    """Issues D-Bus calls without blocking and returns an asyncio future for
+    each. Replies are dispatched by the GLib main-loop thread and handed over
+    to the event-loop.
+    """
+
+    def __init__(self, bus=None, loop=None):
+        self.__bus = bus if bus is not None else _get_async_bus()
+        self.__loop = loop if loop is not None else asyncio.get_event_loop()
+
+        start_main_loop_thread()
+
+    @property
+    def bus(self):
+        return self.__bus
+
+    @property
+    def loop(self):
+        return self.__loop
+
+    def call(self, object_path, interface_name, method_name, args,
+             signature):
+        interface = self.__bus.get_interface(object_path, interface_name)
+
+        loop = self.__loop
+        future = asyncio.Future(loop=loop)
+
+        def set_result(value):
+            if future.cancelled() is False:
+                future.set_result(value)
+
+        def set_exception(e):
+            if future.cancelled() is False:
+                future.set_exception(e)
+
+        def reply_handler(*reply):
+            if len(reply) == 0:
+                value = None
+            elif len(reply) == 1:
+                value = reply[0]
+            else:
+                value = reply
+
+            loop.call_soon_threadsafe(set_result, value)
+
+        def error_handler(e):
+            loop.call_soon_threadsafe(set_exception, e)
+
+        getattr(interface, method_name)(
+            *args,
+            signature=signature,
+            reply_handler=reply_handler,
+            error_handler=error_handler)
+
+        return future
+
+
+class AsyncUpstartSystem(object):
+    """The awaitable counterpart of UpstartSystem. Every method returns a
+    future.
+    """
+
+    def __init__(self, bus=None, loop=None):
+        self.__caller = _AsyncCaller(bus=bus, loop=loop)
+
+    def __get_property(self, name):
+        return self.__caller.call(
+                UPSTART_OBJECT_PATH,
+                PROPERTIES_INTERFACE,
+                'Get',
+                (UPSTART_INTERFACE, name),
+                'ss')
+
+    def get_version(self):
+        return self.__get_property('version')
+
+    def get_log_priority(self):
+        return self.__get_property('log_priority')
+
+    def set_log_priority(self, priority_string):
+        return self.__caller.call(
+                UPSTART_OBJECT_PATH,
+                PROPERTIES_INTERFACE,
+                'Set',
+                (UPSTART_INTERFACE, 'log_priority', priority_string),
+                'ssv')
+
+    def get_all_jobs(self):
+        """Resolves to a list of job names."""
+
+        future = asyncio.Future(loop=self.__caller.loop)
+
+        def jobs_received(f):
+            if future.cancelled() is True:
+                return
+            elif f.exception() is not None:
+                future.set_exception(f.exception())
+            else:
+                future.set_result([j[j.rfind('/') + 1:] for j in f.result()])
+
+        self.__caller.call(
+            UPSTART_OBJECT_PATH,
+            UPSTART_INTERFACE,
+            'GetAllJobs',
+            (),
+            '').add_done_callback(jobs_received)
+
+        return future
+
+    def emit(self, event_name, env={}, is_sync=True):
+        return self.__caller.call(
+                UPSTART_OBJECT_PATH,
+                UPSTART_INTERFACE,
+                'EmitEvent',
+                (event_name, get_env_list(env), is_sync),
+                'sasb')
+
+
+class AsyncUpstartJob(object):
+    """The awaitable counterpart of UpstartJob. Every method returns a
+    future.
+    """
+
+    def __init__(self, job_name, bus=None, loop=None):
+        if job_name[0] == '/':
+            raise ValueError("Expected simple, short job name: %s" %
+                             (job_name))
+
+        self.__caller = _AsyncCaller(bus=bus, loop=loop)
+        self.__job_name = job_name
+
+        self.__job_path = ('%s/%s' % (UPSTART_JOBS_PATH, self.__job_name))
+        self.__default_instance_path = ('%s/_' % (self.__job_path))
+
+    def get_status(self):
+        return self.__caller.call(
+                self.__default_instance_path,
+                PROPERTIES_INTERFACE,
+                'GetAll',
+                ('',),
+                's')
+
+    def __get_conditions(self, type_):
+        return self.__caller.call(
+                self.__job_path,
+                PROPERTIES_INTERFACE,
+                'Get',
+                (JOB_INTERFACE, type_),
+                'ss')
+
+    def get_start_on_condition(self):
+        return self.__get_conditions('start_on')
+
+    def get_stop_on_condition(self):
+        return self.__get_conditions('stop_on')
+
+    def __control(self, method_name):
+        # Upstart only replies once the state-transition has finished, but
+        # nothing blocks while it does.
+        return self.__caller.call(
+                self.__job_path,
+                JOB_INTERFACE,
+                method_name,
+                ([], True),
+                'asb')
+
+    def start(self):
+        return self.__control('Start')
+
+    def stop(self):
+        return self.__control('Stop')
+
+    def restart(self):
+        return self.__control('Restart')
@@ -0,0 +1,167 @@
+import time
+
+from upstart.bus import get_bus, CallPipeline, UPSTART_JOBS_PATH, \
+                        JOB_INTERFACE, INSTANCE_INTERFACE
+from upstart.job import UpstartJob
+from upstart.names import encode_name, decode_name
+from upstart.system import get_env_list
+
+DEFAULT_CONCURRENCY = 16
+
+
+class BatchResult(object):
+    """The outcome of one job's (or instance's) operation in a batch."""
+
+    def __init__(self, job_name, action, instance_name=None):
+        self.job_name = job_name
+        self.instance_name = instance_name
+        self.action = action
+        self.success = None
+        self.error = None
+        self.elapsed_s = None
+
+    def __repr__(self):
+        if self.instance_name is None:
+            target = self.job_name
+        else:
+            target = ('%s (%s)' % (self.job_name, self.instance_name))
+
+        return ('<BatchResult %s %s success=%s elapsed_s=%s>' %
+                (self.action, target, self.success, self.elapsed_s))
+
+
+class BatchController(object):
+    """Starts, stops, or restarts many jobs (or instances of one job) in
+    parallel, with at most `concurrency` state-transitions under way at a
+    time. Jobs are given by their real names (e.g. "avahi-daemon").
+
+    A job that fails (even before its call can be made) only fails its own
+    result.
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, bus=None,
+                 timeout_s=None):
+        self.__concurrency = concurrency
+        self.__bus = bus if bus is not None else get_bus()
+        self.__timeout_s = timeout_s
+
+    def __run(self, calls):
+        """Run (BatchResult, object path, interface, method name, arguments,
+        signature) calls.
+        """
+
+        pipeline = CallPipeline(bus=self.__bus,
+                                max_in_flight=self.__concurrency)
+        results = []
+
+        def submit(result, object_path, interface_name, method_name, args,
+                   signature):
+            results.append(result)
+            started_at = [time.time()]
+
+            def finish(error):
+                result.elapsed_s = time.time() - started_at[0]
+                result.success = error is None
+                result.error = error
+
+            try:
+                interface = self.__bus.get_interface(object_path,
+                                                     interface_name)
+
+                method = getattr(interface, method_name)
+            except Exception as e:
+                finish(e)
+                return
+
+            # Time from when the call is actually issued, not from when it was
+            # queued behind the concurrency limit.
+            def issue(*args, **kwargs):
+                started_at[0] = time.time()
+                method(*args, **kwargs)
+
+            def replied(*reply):
+                # Starts and restarts reply with the instance's path.
+                if reply and result.instance_name is None:
+                    instance_path = reply[0]
+                    result.instance_name = decode_name(
+                        instance_path[instance_path.rfind('/') + 1:])
+
+                finish(None)
+
+            pipeline.submit(
+                issue,
+                args,
+                signature,
+                reply_handler=replied,
+                error_handler=finish,
+                timeout=self.__timeout_s)
+
+        for call in calls:
+            submit(*call)
+
+        pipeline.wait()
+        return results
+
+    def __control_jobs(self, method_name, job_names):
+        return self.__run(((BatchResult(job_name, method_name.lower()),
+                            '%s/%s' % (UPSTART_JOBS_PATH,
+                                       encode_name(job_name)),
+                            JOB_INTERFACE,
+                            method_name,
+                            ([], True),
+                            'asb')
+                           for job_name
+                           in job_names))
+
+    def start(self, job_names):
+        """Start the jobs and return a list of BatchResults, in the same order.
+        """
+
+        return self.__control_jobs('Start', job_names)
+
+    def stop(self, job_names):
+        return self.__control_jobs('Stop', job_names)
+
+    def restart(self, job_names):
+        return self.__control_jobs('Restart', job_names)
+
+    def start_instances(self, job_name, envs):
+        """Start one instance of a multi-instance job per environment (e.g.
+        [{'N': 1}, {'N': 2}]). The instance names are filled into the results
+        as the instances are started.
+        """
+
+        return self.__run(((BatchResult(job_name, 'start'),
+                            '%s/%s' % (UPSTART_JOBS_PATH,
+                                       encode_name(job_name)),
+                            JOB_INTERFACE,
+                            'Start',
+                            (get_env_list(env), True),
+                            'asb')
+                           for env
+                           in envs))
+
+    def __control_instances(self, method_name, job_name, instance_names):
+        j = UpstartJob(encode_name(job_name), bus=self.__bus)
+
+        if instance_names is None:
+            instance_names = j.get_instances()
+
+        return self.__run(((BatchResult(job_name,
+                                        method_name.lower(),
+                                        instance_name=instance_name),
+                            j.get_instance_path(instance_name),
+                            INSTANCE_INTERFACE,
+                            method_name,
+                            (True,),
+                            'b')
+                           for instance_name
+                           in instance_names))
+
+    def stop_instances(self, job_name, instance_names=None):
+        """Stop instances of a job by name (by default, all of them)."""
+
+        return self.__control_instances('Stop', job_name, instance_names)
+
+    def restart_instances(self, job_name, instance_names=None):
+        return self.__control_instances('Restart', job_name, instance_names)
@@ -0,0 +1,413 @@
+import threading
+
+from collections import OrderedDict, deque
+
+import dbus
+import dbus.bus
+
+try:
+    from dbus.mainloop.glib import DBusGMainLoop, threads_init
+except ImportError:
+    DBusGMainLoop = None
+
+try:
+    from gi.repository import GLib as _glib
+    _get_main_context = _glib.MainContext.default
+except ImportError:
+    try:
+        import gobject as _glib
+        _get_main_context = _glib.main_context_default
+    except ImportError:
+        _get_main_context = None
+
+UPSTART_BUS_NAME = 'com.ubuntu.Upstart'
+UPSTART_OBJECT_PATH = '/com/ubuntu/Upstart'
+UPSTART_JOBS_PATH = '/com/ubuntu/Upstart/jobs'
+
+UPSTART_INTERFACE = 'com.ubuntu.Upstart0_6'
+JOB_INTERFACE = 'com.ubuntu.Upstart0_6.Job'
+INSTANCE_INTERFACE = 'com.ubuntu.Upstart0_6.Instance'
+PROPERTIES_INTERFACE = 'org.freedesktop.DBus.Properties'
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_MAX_IN_FLIGHT = 64
+
+_default_bus = None
+_default_bus_lock = threading.Lock()
+
+_main_loop_thread = None
+_main_loop_thread_lock = threading.Lock()
+
+
+class UpstartBus(object):
+    """One system-bus connection with an LRU registry of proxy-objects and
+    interfaces, keyed by object-path.
+
+    Proxies are created without introspection, so every call made through
+    this class has to pass an explicit D-Bus signature.
+    """
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE, address=None):
+        """`address` connects to a bus other than the system bus (e.g. a 
+        private one for testing).
+        """
+
+        assert issubclass(cache_size.__class__, int) and cache_size > 0
+
+        self.__cache_size = cache_size
+        self.__address = address
+        self.__connection = None
+        self.__lock = threading.RLock()
+
+        # Maps object-path to a tuple of the proxy and a dictionary of the
+        # interfaces that have been wrapped around it.
+        self.__entries = OrderedDict()
+
+        self.__hits = 0
+        self.__misses = 0
+
+    def __create_connection(self):
+        # The GLib main-loop is required for asynchronous calls and signals. 
+        # Synchronous calls work without it.
+        kwargs = {}
+        if DBusGMainLoop is not None:
+            kwargs['mainloop'] = DBusGMainLoop()
+
+        if self.__address is not None:
+            return dbus.bus.BusConnection(self.__address, **kwargs)
+        else:
+            return dbus.SystemBus(private=True, **kwargs)
+
+    @property
+    def main_context(self):
+        """The GLib main-context that asynchronous replies and signals are 
+        dispatched on.
+        """
+
+        if DBusGMainLoop is None or _get_main_context is None:
+            raise EnvironmentError("Asynchronous calls require dbus.mainloop."
+                                   "glib and PyGObject.")
+
+        # Make sure that the connection (and its main-loop) exists.
+        self.connection
+
+        return _get_main_context()
+
+    @property
+    def connection(self):
+        with self.__lock:
+            if self.__connection is None:
+                self.__connection = self.__create_connection()
+
+            return self.__connection
+
+    def __get_entry(self, object_path):
+        try:
+            entry = self.__entries.pop(object_path)
+        except KeyError:
+            self.__misses += 1
+
+            o = self.connection.get_object(
+                    UPSTART_BUS_NAME,
+                    object_path,
+                    introspect=False)
+
+            entry = (o, {})
+
+            if len(self.__entries) >= self.__cache_size:
+                self.__entries.popitem(last=False)
+        else:
+            self.__hits += 1
+
+        # Reinsert so that the entry is the most-recently used.
+        self.__entries[object_path] = entry
+        return entry
+
+    def get_object(self, object_path):
+        with self.__lock:
+            return self.__get_entry(object_path)[0]
+
+    def get_interface(self, object_path, interface_name):
+        with self.__lock:
+            (o, interfaces) = self.__get_entry(object_path)
+
+            try:
+                return interfaces[interface_name]
+            except KeyError:
+                interface = dbus.Interface(o, interface_name)
+                interfaces[interface_name] = interface
+
+                return interface
+
+    def invalidate(self, object_path):
+        """Forget the proxy for a path (e.g. when the job is removed)."""
+
+        with self.__lock:
+            self.__entries.pop(object_path, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def cache_info(self):
+        with self.__lock:
+            return { 'hits': self.__hits,
+                     'misses': self.__misses,
+                     'size': len(self.__entries),
+                     'max_size': self.__cache_size }
+
+    def close(self):
+        with self.__lock:
+            self.__entries.clear()
+
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
+
+
+class CallPipeline(object):
+    """Issues asynchronous D-Bus calls with at most `max_in_flight` of them 
+    outstanding at a time. Replies are dispatched to their handlers while the 
+    pipeline is being waited on (or stepped), or by the main-loop thread if 
+    it's running (see start_main_loop_thread()), in which case waiting just 
+    blocks until the handlers have run.
+
+    Handlers may submit further calls. An error for a call without an error-
+    handler (including one raised by making the call), or an exception raised
+    by a handler, is raised from wait()/step().
+    """
+
+    def __init__(self, bus=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        assert issubclass(max_in_flight.__class__, int) and max_in_flight > 0
+
+        self.__bus = bus if bus is not None else get_bus()
+        self.__context = self.__bus.main_context
+        self.__max_in_flight = max_in_flight
+
+        # Guards the counts and the queue, since the handlers may run on the 
+        # main-loop thread. It's reentrant, so handlers can submit.
+        self.__condition = threading.Condition(threading.RLock())
+
+        self.__queue = deque()
+        self.__in_flight = 0
+        self.__completed = 0
+        self.__errors = []
+
+    @property
+    def in_flight(self):
+        return self.__in_flight
+
+    @property
+    def pending(self):
+        """The number of calls either in-flight or still queued."""
+
+        with self.__condition:
+            return self.__in_flight + len(self.__queue)
+
+    def submit(self, method, args, signature, reply_handler=None, 
+               error_handler=None, timeout=None):
+        """Queue a call to a proxy/interface method. `reply_handler` is called
+        with the return values, if any. `timeout` (seconds) overrides the D-
+        Bus default for the reply.
+        """
+
+        with self.__condition:
+            self.__queue.append((method, args, signature, reply_handler, 
+                                 error_handler, timeout))
+            self.__pump()
+
+    def __pump(self):
+        while self.__queue and self.__in_flight < self.__max_in_flight:
+            (method, args, signature, reply_handler, error_handler, 
+             timeout) = self.__queue.popleft()
+
+            kwargs = { 'signature': signature, 
+                       'reply_handler': self.__wrap_reply(reply_handler), 
+                       'error_handler': self.__wrap_error(error_handler) }
+
+            if timeout is not None:
+                kwargs['timeout'] = timeout
+
+            self.__in_flight += 1
+
+            # A call that fails before it's even sent (e.g. its arguments 
+            # don't fit the signature) is handled like an error reply, so 
+            # that one from a handler isn't lost and the rest still go out.
+            try:
+                method(*args, **kwargs)
+            except Exception as e:
+                self.__in_flight -= 1
+                self.__completed += 1
+
+                self.__handle_error(error_handler, e)
+
+    def __complete(self):
+        with self.__condition:
+            self.__in_flight -= 1
+            self.__completed += 1
+
+            try:
+                self.__pump()
+            finally:
+                self.__condition.notify_all()
+
+    def __wrap_reply(self, reply_handler):
+        def handler(*reply):
+            # Exceptions can't propagate out of a D-Bus callback, so they're 
+            # kept and raised from wait()/step().
+            try:
+                if reply_handler is not None:
+                    reply_handler(*reply)
+            except Exception as e_handler:
+                self.__errors.append(e_handler)
+            finally:
+                self.__complete()
+
+        return handler
+
+    def __handle_error(self, error_handler, e):
+        try:
+            if error_handler is not None:
+                error_handler(e)
+            else:
+                self.__errors.append(e)
+        except Exception as e_handler:
+            self.__errors.append(e_handler)
+
+    def __wrap_error(self, error_handler):
+        def handler(e):
+            try:
+                self.__handle_error(error_handler, e)
+            finally:
+                self.__complete()
+
+        return handler
+
+    def __raise_errors(self):
+        with self.__condition:
+            if not self.__errors:
+                return
+
+            e = self.__errors[0]
+            del self.__errors[:]
+
+        raise e
+
+    def step(self, may_block=True):
+        """Dispatch whatever replies have arrived (waiting for at least one, 
+        if `may_block`).
+        """
+
+        if _is_dispatched_elsewhere() is False:
+            self.__context.iteration(may_block)
+        elif may_block is True:
+            with self.__condition:
+                completed = self.__completed
+                while self.__completed == completed and \
+                      self.__in_flight + len(self.__queue) > 0:
+                    self.__condition.wait()
+
+        self.__raise_errors()
+
+    def throttle(self, limit=None):
+        """Dispatch replies until fewer than `limit` calls (by default, the 
+        in-flight maximum) are pending.
+        """
+
+        if limit is None:
+            limit = self.__max_in_flight
+
+        while self.pending >= limit:
+            self.step()
+
+    def wait(self):
+        """Dispatch replies until no calls are pending."""
+
+        if _is_dispatched_elsewhere() is False:
+            while self.pending > 0:
+                self.__context.iteration(True)
+        else:
+            with self.__condition:
+                while self.__in_flight + len(self.__queue) > 0:
+                    self.__condition.wait()
+
+        self.__raise_errors()
+
+
+def get_bus():
+    """Return the process-wide bus shared by all job and system objects."""
+
+    global _default_bus
+
+    with _default_bus_lock:
+        if _default_bus is None:
+            _default_bus = UpstartBus()
+
+        return _default_bus
+
+
+def set_bus(bus):
+    """Replace the process-wide bus (e.g. to change the cache size)."""
+
+    global _default_bus
+
+    with _default_bus_lock:
+        _default_bus = bus
+
+
+def _is_dispatched_elsewhere():
+    """Return True if the main-loop thread is running, and this isn't it. The
+    main-context mustn't then be iterated here.
+    """
+
+    thread = _main_loop_thread
+    return thread is not None and \
+           thread.is_alive() is True and \
+           thread is not threading.current_thread()
+
+
+def dispatch_pending(bus=None):
+    """Dispatch whatever replies and signals have arrived, without blocking.
+    Nothing needs to be done if the main-loop thread is dispatching them.
+    """
+
+    if _is_dispatched_elsewhere() is True:
+        return
+
+    context = (bus if bus is not None else get_bus()).main_context
+    while context.pending():
+        context.iteration(False)
+
+
+def start_main_loop_thread():
+    """Run the GLib main-loop in a daemon thread, so that asynchronous replies
+    and signals are dispatched without the caller iterating the main-context.
+    Only one such thread is ever started. Once it is running, CallPipeline 
+    and the process_events() methods wait on it rather than iterating the 
+    main-context themselves.
+    """
+
+    global _main_loop_thread
+
+    with _main_loop_thread_lock:
+        if _main_loop_thread is not None:
+            return _main_loop_thread
+
+        if DBusGMainLoop is None or _get_main_context is None:
+            raise EnvironmentError("The main-loop thread requires dbus."
+                                   "mainloop.glib and PyGObject.")
+
+        threads_init()
+
+        # Older PyGObjects need their threading support switched on 
+        # explicitly.
+        if hasattr(_glib, 'threads_init') is True:
+            _glib.threads_init()
+
+        main_loop = _glib.MainLoop()
+
+        _main_loop_thread = threading.Thread(target=main_loop.run)
+        _main_loop_thread.daemon = True
+        _main_loop_thread.start()
+
+        return _main_loop_thread
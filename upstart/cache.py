@@ -0,0 +1,270 @@
+import threading
+
+import dbus.exceptions
+
+from upstart.bus import get_bus, dispatch_pending, CallPipeline, \
+                        UPSTART_BUS_NAME, UPSTART_JOBS_PATH, \
+                        UPSTART_INTERFACE, JOB_INTERFACE, \
+                        INSTANCE_INTERFACE, PROPERTIES_INTERFACE, \
+                        DEFAULT_MAX_IN_FLIGHT
+from upstart.names import encode_name, decode_name
+from upstart.status import JobStatus
+from upstart.system import UpstartSystem
+
+_UNKNOWN_INSTANCE_ERROR = 'com.ubuntu.Upstart0_6.Error.UnknownInstance'
+_UNKNOWN_JOB_ERROR = 'com.ubuntu.Upstart0_6.Error.UnknownJob'
+
+
+def _split_path(object_path):
+    """Split a job or instance path into its (escaped) job and instance
+    elements. The instance element is None for a job path.
+    """
+
+    parts = object_path[len(UPSTART_JOBS_PATH) + 1:].split('/')
+    if len(parts) == 1:
+        return (parts[0], None)
+    else:
+        return (parts[0], parts[1])
+
+
+class JobStateCache(object):
+    """An in-memory index of the goal, state, and processes of every instance
+    of every job, kept current by Upstart's signals rather than by polling.
+
+    Jobs are keyed by the same (escaped) names that get_all_jobs() returns.
+    Signals are only dispatched while the GLib main-context is iterated:
+    either run a main-loop (e.g. start_main_loop_thread()) or call 
+    process_events() (which every read does, without blocking).
+    """
+
+    def __init__(self, bus=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self.__bus = bus if bus is not None else get_bus()
+        self.__max_in_flight = max_in_flight
+        self.__lock = threading.RLock()
+
+        # Job name to a dictionary of instance elements to statuses.
+        self.__jobs = {}
+
+        self.__receivers = []
+        self.__pipeline = None
+        self.__listeners = []
+
+    def add_listener(self, listener):
+        """Call `listener(job_name, instance_name, change, value)` for every
+        change that a signal brings: 'job-added', 'job-removed', 'added', 
+        'removed', 'goal' (with the new goal), 'state' (with the new state), 
+        or 'status' (when an instance's status, with its processes, has been 
+        refetched). It's called from process_events() (or the main-loop).
+        """
+
+        self.__listeners.append(listener)
+
+    def __notify(self, job_name, instance_name, change, value=None):
+        for listener in self.__listeners:
+            listener(job_name, instance_name, change, value)
+
+    def start(self):
+        """Subscribe to the signals and do the initial, pipelined load."""
+
+        if self.__receivers:
+            return self
+
+        connection = self.__bus.connection
+        self.__pipeline = CallPipeline(bus=self.__bus,
+                                       max_in_flight=self.__max_in_flight)
+
+        subscriptions = [
+            (self.__job_added, 'JobAdded', UPSTART_INTERFACE),
+            (self.__job_removed, 'JobRemoved', UPSTART_INTERFACE),
+            (self.__instance_added, 'InstanceAdded', JOB_INTERFACE),
+            (self.__instance_removed, 'InstanceRemoved', JOB_INTERFACE),
+            (self.__goal_changed, 'GoalChanged', INSTANCE_INTERFACE),
+            (self.__state_changed, 'StateChanged', INSTANCE_INTERFACE),
+        ]
+
+        # Subscribe before loading so that no transitions are missed.
+        for (handler, signal_name, interface_name) in subscriptions:
+            receiver = connection.add_signal_receiver(
+                        handler,
+                        signal_name=signal_name,
+                        dbus_interface=interface_name,
+                        bus_name=UPSTART_BUS_NAME,
+                        path_keyword='path')
+
+            self.__receivers.append(receiver)
+
+        s = UpstartSystem(bus=self.__bus)
+        for (job_name, statuses) in s.iter_all_job_statuses(
+                                        max_in_flight=self.__max_in_flight):
+            instances = dict([(encode_name(status['name']), status)
+                              for status
+                              in statuses])
+
+            with self.__lock:
+                # A signal may have already registered newer information.
+                self.__jobs.setdefault(job_name, {})
+                for instance_name, status in instances.items():
+                    self.__jobs[job_name].setdefault(instance_name, status)
+
+        return self
+
+    def close(self):
+        for receiver in self.__receivers:
+            receiver.remove()
+
+        del self.__receivers[:]
+
+        with self.__lock:
+            self.__jobs.clear()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type_, value, traceback):
+        self.close()
+
+    def process_events(self):
+        """Dispatch any signals and refreshes that have arrived, without
+        blocking.
+        """
+
+        if self.__pipeline is None:
+            raise ValueError("The cache has not been started.")
+
+        dispatch_pending(self.__bus)
+
+    def __refresh(self, instance_path):
+        (job_name, instance_name) = _split_path(instance_path)
+
+        def status_received(status):
+            with self.__lock:
+                try:
+                    instances = self.__jobs[job_name]
+                except KeyError:
+                    return
+
+                if instance_name not in instances:
+                    return
+
+                instances[instance_name] = status
+
+            self.__notify(job_name, instance_name, 'status')
+
+        properties_i = self.__bus.get_interface(
+                        instance_path,
+                        PROPERTIES_INTERFACE)
+
+        # The instance may be gone by the time that the request arrives.
+        self.__pipeline.submit(
+            properties_i.GetAll,
+            ('',),
+            's',
+            reply_handler=status_received,
+            error_handler=lambda e: None)
+
+    def __job_added(self, job_path, path=None):
+        (job_name, _) = _split_path(job_path)
+
+        with self.__lock:
+            self.__jobs.setdefault(job_name, {})
+
+        self.__notify(job_name, None, 'job-added')
+
+    def __job_removed(self, job_path, path=None):
+        (job_name, _) = _split_path(job_path)
+
+        with self.__lock:
+            instances = self.__jobs.pop(job_name, {})
+
+        for instance_name in instances.keys():
+            self.__bus.invalidate('%s/%s' % (job_path, instance_name))
+
+        self.__bus.invalidate(job_path)
+        self.__notify(job_name, None, 'job-removed')
+
+    def __instance_added(self, instance_path, path=None):
+        (job_name, instance_name) = _split_path(instance_path)
+
+        with self.__lock:
+            self.__jobs.setdefault(job_name, {})[instance_name] = \
+                { 'name': decode_name(instance_name), 
+                  'goal': '', 
+                  'state': '', 
+                  'processes': [] }
+
+        self.__refresh(instance_path)
+        self.__notify(job_name, instance_name, 'added')
+
+    def __instance_removed(self, instance_path, path=None):
+        (job_name, instance_name) = _split_path(instance_path)
+
+        with self.__lock:
+            self.__jobs.get(job_name, {}).pop(instance_name, None)
+
+        self.__bus.invalidate(instance_path)
+        self.__notify(job_name, instance_name, 'removed')
+
+    def __update(self, instance_path, key, value):
+        (job_name, instance_name) = _split_path(instance_path)
+
+        with self.__lock:
+            try:
+                self.__jobs[job_name][instance_name][key] = value
+            except KeyError:
+                pass
+
+        self.__notify(job_name, instance_name, key, value)
+
+    def __goal_changed(self, goal, path=None):
+        self.__update(path, 'goal', goal)
+
+    def __state_changed(self, state, path=None):
+        self.__update(path, 'state', state)
+
+        # The processes change along with the state.
+        self.__refresh(path)
+
+    def get_all_jobs(self):
+        self.process_events()
+
+        with self.__lock:
+            return list(self.__jobs.keys())
+
+    def get_instances(self, job_name):
+        """Return a dictionary of (escaped) instance names to statuses."""
+
+        self.process_events()
+
+        with self.__lock:
+            try:
+                instances = self.__jobs[job_name]
+            except KeyError:
+                raise dbus.exceptions.DBusException(
+                        "Unknown job: %s" % (job_name),
+                        name=_UNKNOWN_JOB_ERROR)
+
+            return dict([(instance_name, dict(status))
+                         for (instance_name, status)
+                         in instances.items()])
+
+    def get_status(self, job_name, instance_name='_', native=False):
+        """Return the same status dictionary that a GetAll on the instance
+        would (or a JobStatus, if `native`), and raise the same error if the
+        instance doesn't exist.
+        """
+
+        self.process_events()
+
+        with self.__lock:
+            try:
+                status = self.__jobs[job_name][instance_name]
+            except KeyError:
+                raise dbus.exceptions.DBusException(
+                        "Unknown instance: %s/%s" %
+                        (job_name, instance_name),
+                        name=_UNKNOWN_INSTANCE_ERROR)
+
+            if native is True:
+                return JobStatus.from_dbus(job_name, status)
+
+            return dict(status)
@@ -0,0 +1,554 @@
+import fnmatch
+import re
+
+_OPERATORS = ('and', 'or')
+
+# The operators in the list form of a condition (as returned by
+# UpstartJob.get_start_on_condition()), which is in postfix order.
+_CONDITION_OPERATORS = { '/AND': 'and', '/OR': 'or' }
+
+_GLOB_CHARS_RE = re.compile(r'[*?\[]')
+_QUOTE_NEEDED_RE = re.compile(r'[\s()"\'\\]')
+
+
+class EventExpressionError(ValueError):
+    pass
+
+
+def _compile_pattern(pattern):
+    """Return a predicate for an (fnmatch-style) value pattern. Patterns
+    without wildcards are just compared.
+    """
+
+    if _GLOB_CHARS_RE.search(pattern) is None:
+        return lambda value: value == pattern
+
+    match = re.compile(fnmatch.translate(pattern)).match
+    return lambda value: match(value) is not None
+
+
+# The order in which Upstart gives the environment of the events that it
+# (and its bridges) emit, for matching dictionaries positionally.
+_JOB_EVENT_KEYS = ('JOB', 'INSTANCE', 'RESULT', 'PROCESS', 'EXIT_STATUS')
+_ENV_KEY_ORDERS = {
+    'starting': _JOB_EVENT_KEYS,
+    'started': _JOB_EVENT_KEYS,
+    'stopping': _JOB_EVENT_KEYS,
+    'stopped': _JOB_EVENT_KEYS,
+    'runlevel': ('RUNLEVEL', 'PREVLEVEL'),
+    'net-device-up': ('IFACE', 'LOGICAL', 'ADDRFAM', 'METHOD'),
+    'net-device-down': ('IFACE', 'LOGICAL', 'ADDRFAM', 'METHOD'),
+    'mounting': ('DEVICE', 'MOUNTPOINT', 'TYPE', 'OPTIONS'),
+    'mounted': ('DEVICE', 'MOUNTPOINT', 'TYPE', 'OPTIONS'),
+}
+
+
+class _DictEnvPairs(list):
+    """The pairs of a dictionary environment. Only the first
+    `ordered_count` of them have a known position.
+    """
+
+    ordered_count = 0
+
+
+def _get_env_pairs(env, event_name=None):
+    """Normalize an event's environment to a list of (key, value) tuples.
+    Positional matches are made against the order of this list, so give a
+    list of "K=V" strings or (K, V) tuples, as Upstart does. A dictionary
+    is ordered by the keys that Upstart uses for the event (e.g. JOB then
+    INSTANCE); positional matches past those raise EventExpressionError.
+    """
+
+    if env is None:
+        return []
+    elif issubclass(env.__class__, dict) is True:
+        env = dict([(str(k), str(v)) for (k, v) in env.iteritems()])
+
+        pairs = _DictEnvPairs()
+        for key in _ENV_KEY_ORDERS.get(event_name, ()):
+            if key not in env:
+                break
+
+            pairs.append((key, env.pop(key)))
+
+        pairs.extend(sorted(env.items()))
+        # A lone key of an event whose order isn't known is unambiguous.
+        if len(pairs) == 1 and event_name not in _ENV_KEY_ORDERS:
+            pairs.ordered_count = 1
+        else:
+            pairs.ordered_count = len(pairs) - len(env)
+
+        return pairs
+
+    pairs = []
+    for item in env:
+        if issubclass(item.__class__, basestring) is True:
+            (k, _, v) = item.partition('=')
+            pairs.append((k, v))
+        else:
+            pairs.append((str(item[0]), str(item[1])))
+
+    return pairs
+
+
+class EventExpression(object):
+    """A node of a compiled event expression ("start on"/"stop on")."""
+
+    def evaluate(self, events):
+        """Return whether the expression is satisfied by the given events,
+        as (event name, env) tuples (env as taken by EventIndex).
+        """
+
+        normalized = [(name, _get_env_pairs(env, name))
+                      for (name, env)
+                      in events]
+        return self._evaluate(normalized)
+
+    def _evaluate(self, events):
+        raise NotImplementedError()
+
+    def iter_matches(self):
+        """Yield every EventMatch (leaf) of the expression."""
+
+        raise NotImplementedError()
+
+    @property
+    def event_names(self):
+        return frozenset([m.event_name for m in self.iter_matches()])
+
+
+class EventMatch(EventExpression):
+    """Matches one event by name, and optionally by its environment: by
+    position ("runlevel [2345]") and/or by name ("IFACE!=lo"). Values may be
+    fnmatch-style patterns.
+    """
+
+    def __init__(self, event_name, args=()):
+        self.__event_name = event_name
+        self.__args = tuple(args)
+
+        self.__positional = []
+        self.__named = []
+
+        for arg in self.__args:
+            (key, is_named, pattern) = arg.partition('=')
+
+            if is_named == '':
+                self.__positional.append(_compile_pattern(arg))
+            elif key.endswith('!'):
+                self.__named.append(
+                    (key[:-1], True, _compile_pattern(pattern)))
+            else:
+                self.__named.append(
+                    (key, False, _compile_pattern(pattern)))
+
+    @property
+    def event_name(self):
+        return self.__event_name
+
+    @property
+    def args(self):
+        return self.__args
+
+    def matches(self, event_name, env_pairs):
+        """Return whether one event (with its environment as (key, value)
+        tuples) matches.
+        """
+
+        if event_name != self.__event_name:
+            return False
+
+        if len(self.__positional) > len(env_pairs):
+            return False
+
+        if issubclass(env_pairs.__class__, _DictEnvPairs) is True and \
+           len(self.__positional) > env_pairs.ordered_count:
+            raise EventExpressionError(
+                "Matching [%s] needs the environment of [%s] in order (as a "
+                "list), not as a dictionary." % (str(self), event_name))
+
+        for i, is_match in enumerate(self.__positional):
+            if is_match(env_pairs[i][1]) is False:
+                return False
+
+        if self.__named:
+            env = dict(env_pairs)
+
+            for (key, is_negated, is_match) in self.__named:
+                try:
+                    value = env[key]
+                except KeyError:
+                    return False
+
+                if is_match(value) is is_negated:
+                    return False
+
+        return True
+
+    def _evaluate(self, events):
+        for (event_name, env_pairs) in events:
+            if self.matches(event_name, env_pairs) is True:
+                return True
+
+        return False
+
+    def iter_matches(self):
+        yield self
+
+    def __str__(self):
+        def quote(arg):
+            if _QUOTE_NEEDED_RE.search(arg) is None:
+                return arg
+
+            (key, is_named, value) = arg.partition('=')
+            if is_named == '' or _QUOTE_NEEDED_RE.search(key) is not None:
+                (key, value) = (None, arg)
+
+            value = ('"%s"' % (value.replace('\\', '\\\\').\
+                                     replace('"', '\\"')))
+
+            return value if key is None else (key + '=' + value)
+
+        return ' '.join([self.__event_name] +
+                        [quote(arg) for arg in self.__args])
+
+    def __repr__(self):
+        return ('<EventMatch %s>' % (str(self)))
+
+
+class _BinaryExpression(EventExpression):
+    operator = None
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def iter_matches(self):
+        for m in self.left.iter_matches():
+            yield m
+
+        for m in self.right.iter_matches():
+            yield m
+
+    def __str__(self):
+        def phrase(node, is_right):
+            if issubclass(node.__class__, _BinaryExpression) is True and \
+               (is_right is True or node.operator != self.operator):
+                return ('(%s)' % (node))
+
+            return str(node)
+
+        return ('%s %s %s' % (phrase(self.left, False), self.operator,
+                              phrase(self.right, True)))
+
+    def __repr__(self):
+        return ('<%s %s>' % (self.__class__.__name__, str(self)))
+
+
+class And(_BinaryExpression):
+    operator = 'and'
+
+    def _evaluate(self, events):
+        return self.left._evaluate(events) and self.right._evaluate(events)
+
+
+class Or(_BinaryExpression):
+    operator = 'or'
+
+    def _evaluate(self, events):
+        return self.left._evaluate(events) or self.right._evaluate(events)
+
+
+_OPERATOR_CLASSES = { 'and': And, 'or': Or }
+
+
+def _tokenize(text):
+    """Split an expression into words and parentheses. Quotes group (and are
+    removed from) words.
+    """
+
+    tokens = []
+    current = []
+    has_current = False
+    quote = None
+
+    i = 0
+    while i < len(text):
+        c = text[i]
+
+        if c == '\\' and i + 1 < len(text):
+            current.append(text[i + 1])
+            has_current = True
+            i += 1
+        elif quote is not None:
+            if c == quote:
+                quote = None
+            else:
+                current.append(c)
+        elif c in ('"', "'"):
+            quote = c
+            has_current = True
+        elif c.isspace() or c in ('(', ')'):
+            if has_current is True:
+                tokens.append(''.join(current))
+                current = []
+                has_current = False
+
+            if c in ('(', ')'):
+                tokens.append(c)
+        else:
+            current.append(c)
+            has_current = True
+
+        i += 1
+
+    if quote is not None:
+        raise EventExpressionError("Unterminated quote: %s" % (text))
+
+    if has_current is True:
+        tokens.append(''.join(current))
+
+    return tokens
+
+
+def parse_expression(text):
+    """Compile the text of a "start on"/"stop on" expression. As with
+    Upstart, "and" and "or" have the same precedence and group from the left,
+    so use parentheses to say otherwise.
+    """
+
+    tokens = _tokenize(text)
+    position = [0]
+
+    def peek():
+        if position[0] < len(tokens):
+            return tokens[position[0]]
+
+        return None
+
+    def take():
+        token = peek()
+        position[0] += 1
+
+        return token
+
+    def parse_operand():
+        token = take()
+
+        if token is None:
+            raise EventExpressionError("Expression is incomplete: %s" %
+                                       (text))
+        elif token == '(':
+            node = parse_sequence()
+            if take() != ')':
+                raise EventExpressionError("Unbalanced parentheses: %s" %
+                                           (text))
+
+            return node
+        elif token == ')' or token in _OPERATORS:
+            raise EventExpressionError("Unexpected [%s]: %s" % (token, text))
+
+        args = []
+        while peek() is not None and peek() not in ('(', ')') and \
+              peek() not in _OPERATORS:
+            args.append(take())
+
+        return EventMatch(token, args)
+
+    def parse_sequence():
+        node = parse_operand()
+
+        while peek() in _OPERATORS:
+            operator_class = _OPERATOR_CLASSES[take()]
+            node = operator_class(node, parse_operand())
+
+        return node
+
+    node = parse_sequence()
+
+    if peek() is not None:
+        raise EventExpressionError("Unexpected [%s]: %s" % (peek(), text))
+
+    return node
+
+
+def parse_condition(condition):
+    """Compile the list form of a condition, as returned by
+    UpstartJob.get_start_on_condition(). Returns None if there's no
+    condition.
+    """
+
+    stack = []
+    for item in condition:
+        item = [str(part) for part in item]
+        if not item:
+            continue
+
+        try:
+            operator = _CONDITION_OPERATORS[item[0]]
+        except KeyError:
+            stack.append(EventMatch(item[0], item[1:]))
+            continue
+
+        if len(stack) < 2:
+            raise EventExpressionError("Condition is malformed: %s" %
+                                       (condition,))
+
+        right = stack.pop()
+        left = stack.pop()
+        stack.append(_OPERATOR_CLASSES[operator](left, right))
+
+    if len(stack) > 1:
+        raise EventExpressionError("Condition is malformed: %s" %
+                                   (condition,))
+
+    return stack[0] if stack else None
+
+
+def compile_expression(expression):
+    """Compile an expression given as text, in the list form, or already
+    compiled.
+    """
+
+    if expression is None or \
+       issubclass(expression.__class__, EventExpression) is True:
+        return expression
+    elif issubclass(expression.__class__, basestring) is True:
+        return parse_expression(expression)
+    else:
+        return parse_condition(expression)
+
+
+class EventIndex(object):
+    """An index from event names to the jobs whose "start on" and "stop on"
+    conditions refer to them. Lookups only touch the jobs that refer to the
+    event.
+    """
+
+    def __init__(self):
+        # Event names to lists of (job name, action, EventMatch) tuples.
+        self.__by_event = {}
+
+        # (Job name, action) tuples to compiled expressions.
+        self.__expressions = {}
+
+    def add(self, job_name, start_on=None, stop_on=None):
+        """Index a job's conditions (as text, in the list form, or
+        compiled).
+        """
+
+        self.remove(job_name)
+
+        for (action, expression) in (('start', start_on), ('stop', stop_on)):
+            expression = compile_expression(expression)
+            if expression is None:
+                continue
+
+            self.__expressions[(job_name, action)] = expression
+
+            for m in expression.iter_matches():
+                entry = (job_name, action, m)
+
+                try:
+                    self.__by_event[m.event_name].append(entry)
+                except KeyError:
+                    self.__by_event[m.event_name] = [entry]
+
+        return self
+
+    def remove(self, job_name):
+        removed = False
+        for action in ('start', 'stop'):
+            try:
+                expression = self.__expressions.pop((job_name, action))
+            except KeyError:
+                continue
+
+            removed = True
+            for event_name in expression.event_names:
+                entries = [entry
+                           for entry
+                           in self.__by_event.get(event_name, [])
+                           if (entry[0], entry[1]) != (job_name, action)]
+
+                if entries:
+                    self.__by_event[event_name] = entries
+                else:
+                    del self.__by_event[event_name]
+
+        return removed
+
+    def get_expression(self, job_name, action='start'):
+        return self.__expressions.get((job_name, action))
+
+    def matching(self, event_name, env=None):
+        """Return a sorted list of (job name, action) tuples for the jobs
+        whose conditions contain a match for the event (though the rest of
+        the condition might still be outstanding).
+        """
+
+        env_pairs = _get_env_pairs(env, event_name)
+
+        found = set()
+        for (job_name, action, m) in self.__by_event.get(event_name, ()):
+            if (job_name, action) not in found and \
+               m.matches(event_name, env_pairs) is True:
+                found.add((job_name, action))
+
+        return sorted(found)
+
+    def triggered(self, event_name, env=None, seen=()):
+        """Return a sorted list of (job name, action) tuples for the jobs
+        whose conditions are satisfied by the event, given the (event name,
+        env) tuples in `seen` that have already happened.
+        """
+
+        events = [(name, _get_env_pairs(env_, name))
+                  for (name, env_)
+                  in seen]
+
+        events.append((event_name, _get_env_pairs(env, event_name)))
+
+        return [key
+                for key
+                in self.matching(event_name, env)
+                if self.__expressions[key]._evaluate(events) is True]
+
+    def __len__(self):
+        return len(set([job_name for (job_name, _) in self.__expressions]))
+
+    @classmethod
+    def from_jobs(cls, jobs):
+        """Build from a dictionary of job names to JobBuilders or JobSpecs."""
+
+        index = cls()
+        for job_name, job in jobs.iteritems():
+            stanzas = dict(job.get_stanzas()
+                           if hasattr(job, 'get_stanzas') is True
+                           else job.stanzas)
+
+            start_on = stanzas.get('start on')
+            stop_on = stanzas.get('stop on')
+
+            index.add(job_name,
+                      start_on[-1] if start_on else None,
+                      stop_on[-1] if stop_on else None)
+
+        return index
+
+    @classmethod
+    def from_system(cls, bus=None):
+        """Build from the conditions of every job that Upstart has loaded."""
+
+        from upstart.job import UpstartJob
+        from upstart.system import UpstartSystem
+
+        index = cls()
+        for job_name in UpstartSystem(bus=bus).get_all_jobs():
+            j = UpstartJob(job_name, bus=bus)
+
+            index.add(job_name,
+                      j.get_start_on_condition(),
+                      j.get_stop_on_condition())
+
+        return index
@@ -1,40 +1,193 @@
-import dbus
+import time
+
+from upstart.bus import get_bus, CallPipeline, UPSTART_JOBS_PATH, \
+                        JOB_INTERFACE, INSTANCE_INTERFACE, PROPERTIES_INTERFACE
+from upstart.names import encode_name, decode_name
+from upstart.status import JobStatus
+from upstart.system import get_env_list
+
+
+class JobOperation(object):
+    """A start, stop, or restart that was issued without waiting. Upstart 
+    replies once the state-transition has finished, and the reply is picked up
+    by done() or wait().
+    """
+
+    def __init__(self, job_name, action, method, args, signature, bus, 
+                 timeout_s=None):
+        self.__job_name = job_name
+        self.__action = action
+
+        self.__finished = False
+        self.__error = None
+        self.__elapsed_s = None
+
+        self.__started_at = time.time()
+
+        self.__pipeline = CallPipeline(bus=bus, max_in_flight=1)
+        self.__pipeline.submit(
+            method, 
+            args, 
+            signature, 
+            reply_handler=self.__reply_received, 
+            error_handler=self.__error_received, 
+            timeout=timeout_s)
+
+    def __finish(self):
+        self.__finished = True
+        self.__elapsed_s = time.time() - self.__started_at
+
+    def __reply_received(self, *reply):
+        self.__finish()
+
+    def __error_received(self, e):
+        self.__error = e
+        self.__finish()
+
+    @property
+    def job_name(self):
+        return self.__job_name
+
+    @property
+    def action(self):
+        return self.__action
+
+    @property
+    def elapsed_s(self):
+        """How long the operation took, or None if it hasn't finished."""
+
+        return self.__elapsed_s
+
+    def done(self):
+        """Pick up the reply, if it has arrived, without blocking."""
+
+        if self.__finished is False:
+            self.__pipeline.step(False)
+
+        return self.__finished
+
+    def wait(self, timeout_s=None):
+        """Wait for the transition to finish and raise its error, if any. 
+        Returns False if `timeout_s` expired first.
+        """
+
+        if timeout_s is not None:
+            stop_at = time.time() + timeout_s
+
+        while self.__finished is False:
+            if timeout_s is None:
+                self.__pipeline.step()
+            elif time.time() < stop_at:
+                self.__pipeline.step(False)
+                time.sleep(0.01)
+            else:
+                return False
+
+        if self.__error is not None:
+            raise self.__error
+
+        return True
 
 
 class UpstartJob(object):
-    def __init__(self, job_name):
+    def __init__(self, job_name, bus=None, cache=None):
+        """If a started JobStateCache is given, statuses are read from it 
+        rather than from the bus.
+        """
+
         if job_name[0] == '/':
             raise ValueError("Expected simple, short job name: %s" % 
                              (job_name))
 
-        self.__system = dbus.SystemBus()
+        self.__bus = bus if bus is not None else get_bus()
         self.__job_name = job_name
+        self.__cache = cache
+
+        self.__job_path = ('%s/%s' % (UPSTART_JOBS_PATH, self.__job_name))
+
+        # Instance paths are derived from the instance names, so they're 
+        # remembered rather than looked up.
+        self.__instance_paths = {}
 
-        self.__o = self.__system.get_object(
-                'com.ubuntu.Upstart', 
-                '/com/ubuntu/Upstart/jobs/%s' % (self.__job_name))
+    def get_instance_path(self, instance_name):
+        try:
+            return self.__instance_paths[instance_name]
+        except KeyError:
+            instance_path = ('%s/%s' % 
+                             (self.__job_path, encode_name(instance_name)))
 
-        self.__job_i = dbus.Interface(
-                        self.__o, 
-                        'com.ubuntu.Upstart0_6.Job')
+            self.__instance_paths[instance_name] = instance_path
+            return instance_path
 
-    def get_status(self):
-        o = self.__system.get_object(
-                'com.ubuntu.Upstart', 
-                '/com/ubuntu/Upstart/jobs/%s/_' % (self.__job_name))
+    def get_instances(self):
+        """Return the names of the job's active instances. The default 
+        instance of a single-instance job is named ''.
+        """
 
-        properties_i = dbus.Interface(
-                        o, 
-                        'org.freedesktop.DBus.Properties')
+        instance_paths = self.__get_job_i().GetAllInstances(signature='')
 
-        return properties_i.GetAll('')
+        instance_names = []
+        for instance_path in instance_paths:
+            instance_name = decode_name(
+                                instance_path[instance_path.rfind('/') + 1:])
+
+            self.__instance_paths[instance_name] = instance_path
+            instance_names.append(instance_name)
+
+        return instance_names
+
+    def get_instance_name(self, env):
+        """Return the name of the instance that the given environment (e.g. 
+        {'N': 3} for "instance $N") selects.
+        """
+
+        instance_path = self.__get_job_i().GetInstance(
+                            get_env_list(env), 
+                            signature='as')
+
+        return decode_name(instance_path[instance_path.rfind('/') + 1:])
+
+    def get_status(self, native=False, instance_name=''):
+        """Return the status of an instance (by default, the default one). If
+        `native` is True, return a JobStatus rather than the raw D-Bus 
+        dictionary.
+        """
+
+        if self.__cache is not None:
+            return self.__cache.get_status(
+                    self.__job_name, 
+                    encode_name(instance_name), 
+                    native=native)
+
+        properties_i = self.__bus.get_interface(
+                        self.get_instance_path(instance_name), 
+                        PROPERTIES_INTERFACE)
+
+        status = properties_i.GetAll('', signature='s')
+
+        if native is True:
+            return JobStatus.from_dbus(self.__job_name, status)
+
+        return status
+
+    def get_instance_statuses(self, native=False):
+        """Return a dictionary of instance names to statuses."""
+
+        return dict([(instance_name, 
+                      self.get_status(native=native, 
+                                      instance_name=instance_name))
+                     for instance_name 
+                     in self.get_instances()])
 
     def __get_conditions(self, type_):
-        properties_i = dbus.Interface(
-                        self.__o, 
-                        'org.freedesktop.DBus.Properties')
+        properties_i = self.__bus.get_interface(
+                        self.__job_path, 
+                        PROPERTIES_INTERFACE)
 
-        return properties_i.Get('com.ubuntu.Upstart0_6.Job', type_)
+        return properties_i.Get(JOB_INTERFACE, type_, signature='ss')
+
+    def __get_job_i(self):
+        return self.__bus.get_interface(self.__job_path, JOB_INTERFACE)
 
     def get_start_on_condition(self):
         return self.__get_conditions('start_on')
@@ -42,11 +195,76 @@ class UpstartJob(object):
     def get_stop_on_condition(self):
         return self.__get_conditions('stop_on')
 
-    def start(self):
-        self.__job_i.Start('', True)
+    def __call(self, action, method, args, signature, wait, timeout_s):
+        if wait is True:
+            if timeout_s is None:
+                return method(*args, signature=signature)
+            else:
+                return method(*args, signature=signature, timeout=timeout_s)
+        else:
+            return JobOperation(
+                    self.__job_name, 
+                    action, 
+                    method, 
+                    args, 
+                    signature, 
+                    self.__bus, 
+                    timeout_s=timeout_s)
+
+    def __control(self, method_name, wait, timeout_s, env):
+        method = getattr(self.__get_job_i(), method_name)
+
+        operation = self.__call(
+                        method_name.lower(), 
+                        method, 
+                        (get_env_list(env), True), 
+                        'asb', 
+                        wait, 
+                        timeout_s)
+
+        if wait is False:
+            return operation
+
+    def start(self, wait=True, timeout_s=None, env=None):
+        """Start the job. If `wait` is False, return a JobOperation 
+        immediately rather than blocking until the job has started. For a 
+        multi-instance job, `env` selects (and populates) the instance.
+        """
+
+        return self.__control('Start', wait, timeout_s, env)
+
+    def stop(self, wait=True, timeout_s=None, env=None):
+        return self.__control('Stop', wait, timeout_s, env)
+
+    def restart(self, wait=True, timeout_s=None, env=None):
+        return self.__control('Restart', wait, timeout_s, env)
+
+    def __control_instance(self, method_name, instance_name, wait, timeout_s):
+        instance_i = self.__bus.get_interface(
+                        self.get_instance_path(instance_name), 
+                        INSTANCE_INTERFACE)
+
+        method = getattr(instance_i, method_name)
+
+        return self.__call(
+                method_name.lower(), 
+                method, 
+                (True,), 
+                'b', 
+                wait, 
+                timeout_s)
+
+    def start_instance(self, instance_name, wait=True, timeout_s=None):
+        """Start an instance that already exists (e.g. is stopping), by name. 
+        Use start() with an environment to create one.
+        """
+
+        return self.__control_instance('Start', instance_name, wait, 
+                                       timeout_s)
 
-    def stop(self):
-        self.__job_i.Stop('', True)
+    def stop_instance(self, instance_name, wait=True, timeout_s=None):
+        return self.__control_instance('Stop', instance_name, wait, timeout_s)
 
-    def restart(self):
-        self.__job_i.Restart('', True)
+    def restart_instance(self, instance_name, wait=True, timeout_s=None):
+        return self.__control_instance('Restart', instance_name, wait, 
+                                       timeout_s)
@@ -1,91 +1,317 @@
+import mmap
+import os
+import re
+
 from collections import OrderedDict
 from cStringIO import StringIO
 
+from upstart.events import EventExpression
+from upstart.job_spec import JobSpec
+from upstart.job_writer import AtomicJobWriter
+
+
+# Script files at least this large are mapped rather than read.
+_MMAP_THRESHOLD = 1024 * 1024
+
+_CHUNK_SIZE = 256 * 1024
+
+_NON_WHITESPACE_RE = re.compile(r'\S')
+
+
+def _copy_stripped(read, f):
+    """Copy chunks (from a read(size) callable) to a file-like object,
+    dropping leading whitespace and adding a final newline if there isn't
+    one.
+    """
+
+    is_started = False
+    last = ''
+
+    while True:
+        chunk = read(_CHUNK_SIZE)
+        if not chunk:
+            break
+
+        if is_started is False:
+            chunk = chunk.lstrip()
+            if not chunk:
+                continue
+
+            is_started = True
+
+        f.write(chunk)
+        last = chunk[-1]
+
+    if last != "\n":
+        f.write("\n")
+
+
+def _copy_stripped_file(filepath, f):
+    with open(filepath, 'rb') as source:
+        size = os.fstat(source.fileno()).st_size
+        if size < _MMAP_THRESHOLD:
+            _copy_stripped(source.read, f)
+            return
+
+        m = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        match = _NON_WHITESPACE_RE.search(m)
+        if match is None:
+            f.write("\n")
+            return
+
+        # Slices of the mapping are written without an intermediate copy 
+        # of the whole file.
+        for i in xrange(match.start(), size, _CHUNK_SIZE):
+            f.write(buffer(m, i, _CHUNK_SIZE))
+
+        if m[size - 1] != "\n":
+            f.write("\n")
+    finally:
+        m.close()
+
 
 class _JobScriptBase(object):
     def __init__(self, code):
         code = code.lstrip()
 
-        if code[-1] != "\n":
+        if code[-1:] != "\n":
             code += "\n"
 
-        self.code = code
+        self.__code = code
+        self.__source = None
+
+    @classmethod
+    def from_file(cls, source, *args, **kwargs):
+        """Take the script from a file path or a file-like object, rather 
+        than from a string. It's streamed into the job file when the job is 
+        written (large files are mapped), rather than held in memory. A 
+        file-like object is read from its current position each time.
+        """
+
+        script = cls('', *args, **kwargs)
+
+        if issubclass(source.__class__, basestring) is True:
+            script.__source = source
+        else:
+            script.__source = (source, source.tell())
+
+        return script
+
+    @property
+    def is_streamed(self):
+        return self.__source is not None
+
+    @property
+    def code(self):
+        if self.__source is None:
+            return self.__code
+
+        s = StringIO()
+        self.__write_code(s)
+
+        return s.getvalue()
+
+    def __write_code(self, f):
+        if self.__source is None:
+            f.write(self.__code)
+        elif issubclass(self.__source.__class__, basestring) is True:
+            _copy_stripped_file(self.__source, f)
+        else:
+            (source, position) = self.__source
+            source.seek(position)
+
+            _copy_stripped(source.read, f)
 
     def __str__(self):
         return self.render()
 
-    def render(self, add_prefix=True):
+    def get_template(self):
+        """Return the (head, tail) text around the code."""
+
         raise NotImplementedError()
 
+    def render(self, add_prefix=True):
+        s = StringIO()
+        self.write(s, add_prefix)
+
+        return s.getvalue()
+
+    def write(self, f, add_prefix=True):
+        """Write the script to a file-like object, streaming the code."""
+
+        (head, tail) = self.get_template()
+
+        if add_prefix is True:
+            f.write("script\n")
+
+        f.write(head)
+        self.__write_code(f)
+        f.write(tail)
+
 
 class JobBashScript(_JobScriptBase):
     def __init__(self, code, shell=None, *args, **kwargs):
         super(JobBashScript, self).__init__(code)
         self.__shell = shell
 
-    def render(self, add_prefix=True):
+    def get_template(self):
         if self.__shell is None:
-            template = """%(code)send script
-"""
+            return ('', "end script\n")
         else:
-            template = """%(shell)s <<EOT
-%(code)sEOT
-end script
-"""
+            return (('%s <<EOT\n' % (self.__shell)), "EOT\nend script\n")
 
-        rendered = template % { 'code': self.code, 
-                                'shell': self.__shell }
 
-        if add_prefix is True:
-            return "script\n" + rendered
-        else:
-            return rendered
+class JobPerlScript(_JobScriptBase):
+    def get_template(self):
+        return ("perl - <<END\n", "END\nend script")
 
 
-class JobPerlScript(_JobScriptBase):
-    def render(self, add_prefix=True):
-        template = """perl - <<END
-%sEND
-end script""" 
+class JobPythonScript(_JobScriptBase):
+    def get_template(self):
+        return ("python - <<END\n", "END\nend script")
 
-        rendered = (template % (self.code))
 
-        if add_prefix is True:
-            return "script\n" + rendered
-        else:
-            return rendered
+class _StreamedStanza(object):
+    """A stanza value that's written straight from a streamed script, 
+    rather than held as a string.
+    """
 
+    def __init__(self, script, add_prefix, leader=''):
+        self.__script = script
+        self.__add_prefix = add_prefix
+        self.__leader = leader
 
-class JobPythonScript(_JobScriptBase):
-    def render(self, add_prefix=True):
-        template = """python - <<END
-%sEND
-end script""" 
+    def write(self, f):
+        f.write(self.__leader)
+        self.__script.write(f, self.__add_prefix)
 
-        rendered = (template % (self.code))
+    def __str__(self):
+        s = StringIO()
+        self.write(s)
 
-        if add_prefix is True:
-            return "script\n" + rendered
-        else:
-            return rendered
+        return s.getvalue()
+
+
+def escape(value):
+    """Escape a value for use within double-quotes."""
+
+    return value.replace('\\', '\\\\').\
+                 replace('"', '\\"').\
+                 replace('\'', '\\\'')
+
+
+def render_many(builders, f=None):
+    """Render many jobs, back to back, into one file-like object. If `f` isn't
+    given, render into a new buffer and return its contents.
+    """
+
+    if f is None:
+        s = StringIO()
+        render_many(builders, s)
+
+        return s.getvalue()
+
+    for jb in builders:
+        jb.write(f)
+
+
+def write_many(jobs):
+    """Write each of an iterable of (filepath, JobBuilder) tuples to its own 
+    file. The files are written atomically, and synced together.
+    """
+
+    with AtomicJobWriter() as w:
+        for (filepath, jb) in jobs:
+            w.write(filepath, jb)
 
 
 class JobBuilder(object):
     def __init__(self):
         self.__stanzas = OrderedDict()
 
+        # The rendered text, until the next change.
+        self.__rendered = None
+
     def __str__(self):
-        self.__validate()
+        if self.__rendered is None:
+            self.__validate()
 
-        s = StringIO()
+            s = StringIO()
+            self.__render(s)
+
+            self.__rendered = s.getvalue()
+
+        return self.__rendered
+
+    def __render(self, f):
         for k, values in self.__stanzas.iteritems():
             for value in values:
-                s.write(k)
-                s.write(' ')
-                s.write(value)
-                s.write("\n")
+                f.write(k)
+                f.write(' ')
 
-        return s.getvalue()
+                if issubclass(value.__class__, _StreamedStanza) is True:
+                    value.write(f)
+                else:
+                    f.write(value)
+
+                f.write("\n")
+
+    def write(self, f):
+        """Write the job to a file-like object. If it hasn't already been 
+        rendered, it's rendered straight into the file rather than into an 
+        intermediate string.
+        """
+
+        if self.__rendered is not None:
+            f.write(self.__rendered)
+        else:
+            self.__validate()
+            self.__render(f)
+
+    @classmethod
+    def from_stanzas(cls, stanzas):
+        """Build from (stanza type, list of raw values) tuples, as returned by
+        get_stanzas(), without going through the individual methods.
+        """
+
+        jb = cls()
+        for (stanza_type, values) in stanzas:
+            jb.__stanzas[stanza_type] = list(values)
+
+        return jb
+
+    def get_stanzas(self):
+        """Return a list of (stanza type, list of raw values) tuples. 
+        Streamed scripts are read into their values.
+        """
+
+        def distill(value):
+            if issubclass(value.__class__, _StreamedStanza) is True:
+                return str(value)
+
+            return value
+
+        return [(stanza_type, [distill(value) for value in values]) 
+                for (stanza_type, values) 
+                in self.__stanzas.iteritems()]
+
+    def to_spec(self):
+        """Return an immutable, compact JobSpec of the job."""
+
+        self.__validate()
+        return JobSpec(self.get_stanzas())
+
+    def set_raw(self, stanza_type, raw=''):
+        """Set a stanza from its raw text (e.g. as read from a job file)."""
+
+        return self.__set(stanza_type, raw)
+
+    def add_raw(self, stanza_type, raw):
+        """Add a stanza that may appear more than once from its raw text."""
+
+        return self.__add(stanza_type, raw)
 
     def __validate(self):
         if 'exec' not in self.__stanzas and \
@@ -100,29 +326,38 @@ class JobBuilder(object):
         except KeyError:
             self.__stanzas[stanza_type] = [raw]
 
+        self.__rendered = None
         return self
 
     def __set(self, stanza_type, raw=''):
         """Add a stanza that may only appear once."""
 
         self.__stanzas[stanza_type] = [raw]
+
+        self.__rendered = None
         return self
 
-    def __script_or_exec_string(self, value, add_prefix=True):
+    def __script_or_exec_string(self, value, add_prefix=True, leader=''):
         if issubclass(value.__class__, _JobScriptBase) is True:
-            value = value.render(add_prefix)
+            if value.is_streamed is True:
+                return _StreamedStanza(value, add_prefix, leader)
+
+            value = leader + value.render(add_prefix)
 
         return value
 
     def run(self, command):
         assert issubclass(command.__class__, (basestring, _JobScriptBase))
 
-        distilled = self.__script_or_exec_string(command, add_prefix=False)
-
         if issubclass(command.__class__, basestring) is True:
-            return self.__set('exec', distilled)
+            return self.__set('exec', command)
         else:
-            return self.__set('script', "\n" + distilled)
+            distilled = self.__script_or_exec_string(
+                            command, 
+                            add_prefix=False, 
+                            leader="\n")
+
+            return self.__set('script', distilled)
 
     def pre_start(self, command):
         assert issubclass(command.__class__, (basestring, _JobScriptBase))
@@ -193,10 +428,16 @@ class JobBuilder(object):
                      conjunct='and')
 
             start_on('abc aa=1 bb=2 and def cc=3 dd=4')
+
+        A compiled expression (see upstart.events) may also be given.
         """
 
-        assert issubclass(events.__class__, (basestring, list))
-        assert issubclass(conjunct.__class__, (None, basestring))
+        assert issubclass(events.__class__, 
+                          (basestring, list, EventExpression))
+        assert conjunct is None or issubclass(conjunct.__class__, basestring)
+
+        if issubclass(events.__class__, EventExpression) is True:
+            return self.__set('start on', str(events))
 
         events = self.__stringify_events(events, conjunct)
         return self.__set('start on', events)
@@ -225,8 +466,12 @@ class JobBuilder(object):
     def stop_on(self, events, conjunct=None):
         """Specifies which events to stop on. Similar syntax as "start on"."""
 
-        assert issubclass(events.__class__, (basestring, list))
-        assert issubclass(conjunct.__class__, (None, basestring))
+        assert issubclass(events.__class__, 
+                          (basestring, list, EventExpression))
+        assert conjunct is None or issubclass(conjunct.__class__, basestring)
+
+        if issubclass(events.__class__, EventExpression) is True:
+            return self.__set('stop on', str(events))
 
         events = self.__stringify_events(events, conjunct)
         return self.__set('stop on', events)
@@ -253,9 +498,7 @@ class JobBuilder(object):
         return self.__set('stop on', ('stopped %s' % (service)))
 
     def __escape(self, value):
-        return value.replace('\\', '\\\\').\
-                     replace('"', '\\"').\
-                     replace('\'', '\\\'')
+        return escape(value)
 
     def __quote(self, text):
         return "\"%s\"" % (self.__escape(text))
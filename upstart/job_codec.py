@@ -0,0 +1,217 @@
+"""Versioned encodings of sets of jobs (job names to their stanzas), as JSON
+or as a compact binary format. Decoding builds the jobs straight from their
+stanzas, without replaying the builder's methods.
+
+The binary format is:
+
+    "UPJB"
+    version (uint16)
+    string count (uint32)
+    string lengths (uint32 each)
+    strings (UTF-8, back to back)
+    records (uint32 each): job count, then for each job its name, its
+        stanza count, and for each stanza its type, its value count, and
+        its values
+
+Strings (names, stanza types, and values) are stored once, and referred to
+by their index. Integers are little-endian.
+"""
+
+import array
+import json
+import struct
+import sys
+
+from upstart.job_builder import JobBuilder
+from upstart.job_spec import JobSpec
+
+FORMAT_VERSION = 1
+
+_BINARY_MAGIC = 'UPJB'
+_BINARY_HEADER = struct.Struct('<4sHI')
+
+_UINT32_TYPECODE = 'I' if array.array('I').itemsize == 4 else 'L'
+
+
+class JobCodecError(ValueError):
+    pass
+
+
+def _get_stanzas(job):
+    """Return the stanzas of a JobBuilder, a JobSpec, or a list of (stanza
+    type, list of raw values) tuples.
+    """
+
+    if issubclass(job.__class__, JobSpec) is True:
+        return job.stanzas
+    elif hasattr(job, 'get_stanzas') is True:
+        return job.get_stanzas()
+    else:
+        return job
+
+
+def _to_str(value):
+    if issubclass(value.__class__, unicode) is True:
+        return value.encode('utf-8')
+
+    return value
+
+
+def _build(stanzas, as_specs, pool):
+    if as_specs is True:
+        return JobSpec(stanzas, pool=pool)
+    else:
+        return JobBuilder.from_stanzas(stanzas)
+
+
+def dumps_json(jobs):
+    """Encode a dictionary of job names to JobBuilders/JobSpecs/stanzas."""
+
+    encoded = dict([(job_name,
+                     [[stanza_type, list(values)]
+                      for (stanza_type, values)
+                      in _get_stanzas(job)])
+                    for (job_name, job)
+                    in jobs.iteritems()])
+
+    return json.dumps({ 'version': FORMAT_VERSION, 'jobs': encoded },
+                      separators=(',', ':'))
+
+
+def loads_json(text, as_specs=False):
+    """Decode into a dictionary of job names to JobBuilders (or JobSpecs)."""
+
+    try:
+        document = json.loads(text)
+    except ValueError as e:
+        raise JobCodecError("Not a valid job set: %s" % (str(e)))
+
+    version = document.get('version')
+    if version != FORMAT_VERSION:
+        raise JobCodecError("Job set version not supported: %s" % (version))
+
+    jobs = {}
+
+    # The decoded specs share their identical stanzas with each other.
+    pool = {}
+
+    for job_name, stanzas in document['jobs'].iteritems():
+        stanzas = [(_to_str(stanza_type), [_to_str(v) for v in values])
+                   for (stanza_type, values)
+                   in stanzas]
+
+        jobs[_to_str(job_name)] = _build(stanzas, as_specs, pool)
+
+    return jobs
+
+
+def dumps_binary(jobs):
+    """Encode a dictionary of job names to JobBuilders/JobSpecs/stanzas."""
+
+    strings = []
+    indices = {}
+
+    def index_of(s):
+        try:
+            return indices[s]
+        except KeyError:
+            indices[s] = len(strings)
+            strings.append(_to_str(s))
+
+            return indices[s]
+
+    records = array.array(_UINT32_TYPECODE, [len(jobs)])
+    for job_name, job in jobs.iteritems():
+        stanzas = _get_stanzas(job)
+
+        records.append(index_of(job_name))
+        records.append(len(stanzas))
+
+        for (stanza_type, values) in stanzas:
+            records.append(index_of(stanza_type))
+            records.append(len(values))
+            records.extend([index_of(value) for value in values])
+
+    lengths = array.array(_UINT32_TYPECODE, [len(s) for s in strings])
+
+    if sys.byteorder == 'big':
+        lengths.byteswap()
+        records.byteswap()
+
+    return ''.join([_BINARY_HEADER.pack(_BINARY_MAGIC, FORMAT_VERSION,
+                                        len(strings)),
+                    lengths.tostring(),
+                    ''.join(strings),
+                    records.tostring()])
+
+
+def loads_binary(data, as_specs=False):
+    """Decode into a dictionary of job names to JobBuilders (or JobSpecs)."""
+
+    if len(data) < _BINARY_HEADER.size:
+        raise JobCodecError("Not a valid job set.")
+
+    (magic, version, string_count) = _BINARY_HEADER.unpack_from(data)
+
+    if magic != _BINARY_MAGIC:
+        raise JobCodecError("Not a valid job set.")
+
+    if version != FORMAT_VERSION:
+        raise JobCodecError("Job set version not supported: %s" % (version))
+
+    try:
+        offset = _BINARY_HEADER.size
+
+        lengths = array.array(_UINT32_TYPECODE)
+        lengths.fromstring(data[offset:offset + string_count * 4])
+        offset += string_count * 4
+
+        records_offset = offset + sum(lengths)
+        if records_offset + 4 > len(data):
+            raise ValueError()
+
+        records = array.array(_UINT32_TYPECODE)
+        records.fromstring(data[records_offset:])
+    except ValueError:
+        raise JobCodecError("Job set is truncated.")
+
+    if sys.byteorder == 'big':
+        lengths.byteswap()
+        records.byteswap()
+
+    strings = []
+    for length in lengths:
+        strings.append(data[offset:offset + length])
+        offset += length
+
+    jobs = {}
+
+    # The decoded specs share their identical stanzas with each other.
+    pool = {}
+
+
+    try:
+        i = 1
+        for _ in xrange(records[0]):
+            job_name = strings[records[i]]
+            stanza_count = records[i + 1]
+            i += 2
+
+            stanzas = []
+            for _ in xrange(stanza_count):
+                value_count = records[i + 1]
+                values = [strings[j]
+                          for j
+                          in records[i + 2:i + 2 + value_count]]
+
+                stanzas.append((strings[records[i]], values))
+                i += 2 + value_count
+
+            jobs[job_name] = _build(stanzas, as_specs, pool)
+    except IndexError:
+        raise JobCodecError("Job set is truncated.")
+
+    if i != len(records):
+        raise JobCodecError("Job set is corrupt.")
+
+    return jobs
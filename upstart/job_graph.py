@@ -0,0 +1,300 @@
+import re
+
+from upstart.events import EventIndex
+
+# The events that Upstart emits for a job, with JOB (and INSTANCE) as their
+# environment.
+_JOB_EVENTS = ('starting', 'started', 'stopping', 'stopped')
+
+_GLOB_CHARS_RE = re.compile(r'[*?\[]')
+
+
+def _get_literal_job_name(m):
+    """Return the job named by a job-event match, if it's named exactly."""
+
+    for arg in m.args:
+        (key, is_named, value) = arg.partition('=')
+
+        if is_named == '':
+            value = arg
+        elif key != 'JOB':
+            continue
+
+        if _GLOB_CHARS_RE.search(value) is None:
+            return value
+
+        break
+
+    return None
+
+
+class JobGraph(object):
+    """The start-order dependencies between jobs, from their "start on"
+    conditions. A job that starts on "started X" or "stopped X" comes after
+    X, and one that starts on "starting X" comes before X (X waits for it).
+    Every job that's referred to counts, even under "or", so the ordering is
+    conservative. Other events (e.g. runlevel) don't add dependencies.
+
+    The results are computed on first use and kept until the graph changes.
+    """
+
+    def __init__(self, index=None):
+        self.__index = index if index is not None else EventIndex()
+        self.__job_names = set()
+
+        self.__dependencies = None
+        self.__cycles = None
+        self.__waves = None
+
+    @classmethod
+    def from_jobs(cls, jobs):
+        """Build from a dictionary of job names to JobBuilders or JobSpecs."""
+
+        graph = cls(EventIndex.from_jobs(jobs))
+        graph.__job_names.update(jobs.keys())
+
+        return graph
+
+    @classmethod
+    def from_system(cls, bus=None):
+        """Build from the conditions of every job that Upstart has loaded."""
+
+        from upstart.system import UpstartSystem
+
+        job_names = list(UpstartSystem(bus=bus).get_all_jobs())
+
+        graph = cls(EventIndex.from_system(bus=bus))
+        graph.__job_names.update(job_names)
+
+        return graph
+
+    def add(self, job_name, start_on=None):
+        """Add (or replace) a job with its "start on" condition (as text, in
+        the list form, or compiled).
+        """
+
+        self.__index.add(job_name, start_on=start_on)
+        self.__job_names.add(job_name)
+
+        self.__invalidate()
+        return self
+
+    def remove(self, job_name):
+        self.__index.remove(job_name)
+        self.__job_names.discard(job_name)
+
+        self.__invalidate()
+
+    def __invalidate(self):
+        self.__dependencies = None
+        self.__cycles = None
+        self.__waves = None
+
+    def __get_referenced_jobs(self, m):
+        job_name = _get_literal_job_name(m)
+        if job_name is not None:
+            return [job_name] if job_name in self.__job_names else []
+
+        return [candidate
+                for candidate
+                in self.__job_names
+                if m.matches(m.event_name,
+                             [('JOB', candidate), ('INSTANCE', '')]) is True]
+
+    def __build(self):
+        if self.__dependencies is not None:
+            return
+
+        dependencies = dict([(job_name, set())
+                             for job_name
+                             in self.__job_names])
+
+        for job_name in self.__job_names:
+            expression = self.__index.get_expression(job_name, 'start')
+            if expression is None:
+                continue
+
+            for m in expression.iter_matches():
+                if m.event_name not in _JOB_EVENTS:
+                    continue
+
+                for other in self.__get_referenced_jobs(m):
+                    if m.event_name == 'starting':
+                        dependencies[other].add(job_name)
+                    else:
+                        dependencies[job_name].add(other)
+
+        self.__dependencies = dependencies
+
+    @property
+    def job_names(self):
+        return frozenset(self.__job_names)
+
+    def get_dependencies(self, job_name):
+        """Return the jobs that must be started before the given one."""
+
+        self.__build()
+        return frozenset(self.__dependencies[job_name])
+
+    def get_dependents(self, job_name):
+        """Return the jobs that wait for the given one."""
+
+        self.__build()
+        return frozenset([other
+                          for (other, dependencies)
+                          in self.__dependencies.iteritems()
+                          if job_name in dependencies])
+
+    def get_cycles(self):
+        """Return a list of cycles (each a sorted list of job names), found
+        as the strongly-connected components with more than one job (or
+        with a job that depends on itself).
+        """
+
+        if self.__cycles is not None:
+            return self.__cycles
+
+        self.__build()
+        dependencies = self.__dependencies
+
+        # Tarjan's algorithm, without recursion.
+        index = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        cycles = []
+        counter = 0
+
+        for root in sorted(dependencies.keys()):
+            if root in index:
+                continue
+
+            work = [(root, iter(sorted(dependencies[root])))]
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+
+            while work:
+                (node, children) = work[-1]
+
+                for child in children:
+                    if child not in index:
+                        index[child] = lowlink[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        on_stack.add(child)
+
+                        work.append((child,
+                                     iter(sorted(dependencies[child]))))
+                        break
+                    elif child in on_stack:
+                        lowlink[node] = min(lowlink[node], index[child])
+                else:
+                    work.pop()
+
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+
+                            if member == node:
+                                break
+
+                        if len(component) > 1 or \
+                           node in dependencies[node]:
+                            cycles.append(sorted(component))
+
+        self.__cycles = cycles
+        return cycles
+
+    def get_waves(self):
+        """Return a list of "waves" (each a sorted list of job names). The
+        jobs of a wave only depend on jobs of earlier waves, so each wave can
+        be started in parallel once the previous one is up. Raises ValueError
+        if there are cycles.
+        """
+
+        if self.__waves is not None:
+            return self.__waves
+
+        cycles = self.get_cycles()
+        if cycles:
+            raise ValueError("Jobs have cyclic dependencies: %s" %
+                             ('; '.join([', '.join(c) for c in cycles])))
+
+        # Kahn's algorithm, a level at a time.
+        remaining = dict([(job_name, len(dependencies))
+                          for (job_name, dependencies)
+                          in self.__dependencies.iteritems()])
+
+        dependents = dict([(job_name, []) for job_name in remaining])
+        for job_name, dependencies in self.__dependencies.iteritems():
+            for dependency in dependencies:
+                dependents[dependency].append(job_name)
+
+        wave = sorted([job_name
+                       for (job_name, count)
+                       in remaining.iteritems()
+                       if count == 0])
+
+        waves = []
+        while wave:
+            waves.append(wave)
+
+            next_wave = []
+            for job_name in wave:
+                for dependent in dependents[job_name]:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        next_wave.append(dependent)
+
+            wave = sorted(next_wave)
+
+        self.__waves = waves
+        return waves
+
+    def get_critical_path(self, durations=None):
+        """Return a (total duration, list of job names) tuple for the
+        longest chain of dependencies, given a dictionary of job names to
+        start-up durations (each job counts as 1 if not given). Raises
+        ValueError if there are cycles.
+        """
+
+        if durations is None:
+            durations = {}
+
+        # The waves are already in topological order.
+        finish = {}
+        previous = {}
+
+        for wave in self.get_waves():
+            for job_name in wave:
+                best = None
+                for dependency in self.__dependencies[job_name]:
+                    if best is None or finish[dependency] > finish[best]:
+                        best = dependency
+
+                started_at = finish[best] if best is not None else 0
+                finish[job_name] = started_at + durations.get(job_name, 1)
+                previous[job_name] = best
+
+        if not finish:
+            return (0, [])
+
+        job_name = max(sorted(finish.keys()), key=lambda j: finish[j])
+        total = finish[job_name]
+
+        path = []
+        while job_name is not None:
+            path.append(job_name)
+            job_name = previous[job_name]
+
+        path.reverse()
+        return (total, path)
@@ -0,0 +1,346 @@
+import errno
+import json
+import os
+import re
+import tempfile
+
+from os.path import basename, dirname, join
+
+from upstart.job_builder import JobBuilder
+
+DEFAULT_INIT_PATH = '/etc/init'
+
+# Stanzas whose first word isn't enough to identify them. The remaining words
+# become part of the stanza type, as the builder does it.
+_COMPOUND_STANZAS = {
+    'start': ('on',),
+    'stop': ('on',),
+    'respawn': ('limit',),
+    'kill': ('timeout', 'signal'),
+    'normal': ('exit',),
+    'apparmor': ('load', 'switch'),
+    'oom': ('score',),
+    'reload': ('signal',),
+}
+
+# Stanzas that may appear more than once.
+_MULTIPLE_STANZAS = set(['env', 'export', 'emits', 'limit', 'kill signal',
+                         'reload signal'])
+
+# Stanzas whose value may be a script-block.
+_PROCESS_STANZAS = set(['pre-start', 'post-start', 'pre-stop', 'post-stop'])
+
+_END_SCRIPT_RE = re.compile(r'^\s*end\s+script\s*$')
+
+# The only stanzas that continue onto further lines while a parenthesis is
+# open.
+_EVENT_STANZA_RE = re.compile(r'^\s*(start|stop)\s+on(\s|$)')
+
+
+class JobParseError(ValueError):
+    def __init__(self, message, line_number, filepath=None):
+        if filepath is not None:
+            message = ('%s (%s:%d)' % (message, filepath, line_number))
+        else:
+            message = ('%s (line %d)' % (message, line_number))
+
+        super(JobParseError, self).__init__(message)
+
+        self.line_number = line_number
+        self.filepath = filepath
+
+
+def _strip_comment(line):
+    """Remove a comment (a '#' that starts a token, outside of quotes), and
+    return the line along with the change in parenthesis-depth.
+    """
+
+    quote = None
+    depth = 0
+
+    i = 0
+    while i < len(line):
+        c = line[i]
+
+        if c == '\\':
+            i += 1
+        elif quote is not None:
+            if c == quote:
+                quote = None
+        elif c in ('"', "'"):
+            quote = c
+        elif c == '#' and (i == 0 or line[i - 1].isspace()):
+            return (line[:i], depth)
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+
+        i += 1
+
+    return (line, depth)
+
+
+def iter_stanzas(f, filepath=None):
+    """Yield a (stanza type, raw value, line number) tuple for each stanza of
+    a job file, reading the file-like object one line at a time. Stanza
+    types and values follow the builder's conventions, so the stanzas can be
+    loaded straight into a JobBuilder.
+    """
+
+    # Lines that were read ahead and put back.
+    pushed_back = []
+
+    def iter_lines():
+        source = iter(f)
+        while True:
+            if pushed_back:
+                yield pushed_back.pop()
+            else:
+                yield next(source)
+
+    lines = iter_lines()
+    line_number = 0
+
+    for line in lines:
+        line_number += 1
+
+        (logical, depth) = _strip_comment(line.rstrip("\n"))
+        first_line_number = line_number
+
+        # Join continued lines (a trailing backslash, or an open parenthesis
+        # in a "start on" or "stop on" event expression).
+        while logical.endswith('\\') or \
+              (depth > 0 and _EVENT_STANZA_RE.match(logical) is not None):
+            if logical.endswith('\\'):
+                logical = logical[:-1]
+
+            try:
+                line = next(lines)
+            except StopIteration:
+                raise JobParseError("Unterminated stanza",
+                                    first_line_number, filepath)
+
+            line_number += 1
+            (continued, continued_depth) = \
+                _strip_comment(line.rstrip("\n"))
+
+            logical = logical.rstrip() + ' ' + continued.strip()
+            depth += continued_depth
+
+        words = logical.split(None, 1)
+        if not words:
+            continue
+
+        stanza_type = words[0]
+        rest = words[1].strip() if len(words) > 1 else ''
+
+        if stanza_type in _COMPOUND_STANZAS or stanza_type == 'expect':
+            parts = rest.split(None, 1)
+
+            if parts and (stanza_type == 'expect' or
+                          parts[0] in _COMPOUND_STANZAS[stanza_type]):
+                stanza_type = ('%s %s' % (stanza_type, parts[0]))
+                rest = parts[1].strip() if len(parts) > 1 else ''
+
+        is_block = (stanza_type == 'script' or
+                    (stanza_type in _PROCESS_STANZAS and rest == 'script'))
+
+        if is_block is True:
+            body = []
+            for line in lines:
+                line_number += 1
+
+                if _END_SCRIPT_RE.match(line) is not None:
+                    break
+
+                body.append(line)
+            else:
+                raise JobParseError("Unterminated script block",
+                                    first_line_number, filepath)
+
+            end = "end script"
+
+            # A blank line right after the block stays with it, since the
+            # builder writes one after a bash script.
+            try:
+                line = next(lines)
+            except StopIteration:
+                pass
+            else:
+                if line.strip() == '':
+                    line_number += 1
+                    end += "\n"
+                else:
+                    pushed_back.append(line)
+
+            if stanza_type == 'script':
+                value = "\n" + ''.join(body) + end
+            else:
+                value = "script\n" + ''.join(body) + end
+
+            yield (stanza_type, value, first_line_number)
+        else:
+            yield (stanza_type, rest, first_line_number)
+
+
+def parse(f, filepath=None):
+    """Parse a job file from a file-like object into a JobBuilder."""
+
+    jb = JobBuilder()
+    for (stanza_type, value, line_number) in iter_stanzas(f, filepath):
+        if stanza_type in _MULTIPLE_STANZAS:
+            jb.add_raw(stanza_type, value)
+        else:
+            jb.set_raw(stanza_type, value)
+
+    return jb
+
+
+def parse_file(filepath):
+    with open(filepath) as f:
+        return parse(f, filepath)
+
+
+# The version of JobParseCache's file format. A cache of any other version is
+# rebuilt.
+_PARSE_CACHE_VERSION = 1
+
+
+def _from_json(value):
+    """Return the original bytes of a string from the parse cache. Strings are
+    stored as Latin-1, which round-trips any bytes (job files needn't be 
+    UTF-8).
+    """
+
+    return value.encode('latin-1')
+
+
+class JobParseCache(object):
+    """Keeps the parsed stanzas of job files in a file (as JSON), keyed by 
+    path and checked against each file's mtime and size. Call save() to 
+    persist any changes.
+    """
+
+    def __init__(self, cache_filepath):
+        self.__cache_filepath = cache_filepath
+        self.__entries = None
+        self.__is_dirty = False
+
+    def __load(self):
+        if self.__entries is not None:
+            return
+
+        try:
+            with open(self.__cache_filepath, 'rb') as f:
+                document = json.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+            self.__entries = {}
+            return
+        except ValueError:
+            # A corrupt cache is just rebuilt.
+            self.__entries = {}
+            return
+
+        try:
+            if document['version'] != _PARSE_CACHE_VERSION:
+                raise ValueError()
+
+            self.__entries = dict([(_from_json(filepath),
+                                    (tuple(key),
+                                     [(_from_json(stanza_type),
+                                       [_from_json(value)
+                                        for value
+                                        in values])
+                                      for (stanza_type, values)
+                                      in stanzas]))
+                                   for (filepath, (key, stanzas))
+                                   in document['entries'].iteritems()])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.__entries = {}
+
+    def get(self, filepath):
+        """Return a JobBuilder for the job file, parsing it only if it has
+        changed since it was cached.
+        """
+
+        self.__load()
+
+        st = os.stat(filepath)
+        key = (st.st_mtime, st.st_size)
+
+        try:
+            (cached_key, stanzas) = self.__entries[filepath]
+        except KeyError:
+            cached_key = None
+
+        if cached_key != key:
+            stanzas = parse_file(filepath).get_stanzas()
+
+            self.__entries[filepath] = (key, stanzas)
+            self.__is_dirty = True
+
+        return JobBuilder.from_stanzas(stanzas)
+
+    def prune(self, filepaths):
+        """Forget every file but the given ones."""
+
+        self.__load()
+
+        keep = set(filepaths)
+        for filepath in list(self.__entries.keys()):
+            if filepath not in keep:
+                del self.__entries[filepath]
+                self.__is_dirty = True
+
+    def save(self):
+        if self.__is_dirty is False:
+            return
+
+        document = { 'version': _PARSE_CACHE_VERSION,
+                     'entries': self.__entries }
+
+        # A unique temporary file, so that concurrent saves don't clobber each
+        # other's before the rename.
+        (fd, temp_filepath) = tempfile.mkstemp(
+                                dir=dirname(self.__cache_filepath) or '.',
+                                prefix=basename(self.__cache_filepath) + '.',
+                                suffix='.tmp')
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                json.dump(document, f, encoding='latin-1', 
+                          separators=(',', ':'))
+
+            os.rename(temp_filepath, self.__cache_filepath)
+        except:
+            os.unlink(temp_filepath)
+            raise
+
+        self.__is_dirty = False
+
+
+def load_directory(init_path=DEFAULT_INIT_PATH, cache=None):
+    """Parse every job file (*.conf) in a directory, and return a dictionary
+    of job names to JobBuilders. If a JobParseCache is given, unchanged files
+    aren't reparsed (the cache isn't saved).
+    """
+
+    jobs = {}
+    for filename in sorted(os.listdir(init_path)):
+        if filename.endswith('.conf') is False:
+            continue
+
+        filepath = join(init_path, filename)
+
+        if cache is not None:
+            jb = cache.get(filepath)
+        else:
+            jb = parse_file(filepath)
+
+        jobs[filename[:-len('.conf')]] = jb
+
+    return jobs
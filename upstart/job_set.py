@@ -0,0 +1,122 @@
+import os
+import re
+
+from os.path import join
+
+from upstart.job_writer import AtomicJobWriter
+from upstart.reload import request_reload
+
+DEFAULT_INIT_PATH = '/etc/init'
+
+_NAME_RE = re.compile(r'^[a-zA-Z0-9\-_.@]+$')
+
+
+class JobSetPlan(object):
+    """The changes needed to bring a job directory to the desired state."""
+
+    def __init__(self, to_write, to_remove, unchanged):
+        # Job names to rendered content.
+        self.to_write = to_write
+
+        self.to_remove = to_remove
+        self.unchanged = unchanged
+        self.reloaded = False
+
+    @property
+    def is_changed(self):
+        return bool(self.to_write or self.to_remove)
+
+    def __repr__(self):
+        return ('<JobSetPlan write=%d remove=%d unchanged=%d>' % 
+                (len(self.to_write), len(self.to_remove), 
+                 len(self.unchanged)))
+
+
+class JobSet(object):
+    """A desired set of jobs for a job directory. apply() writes only the jobs
+    whose content differs from what's on disk, removes the stale ones, and 
+    triggers a single configuration reload if anything changed.
+
+    Only job files that match `prune_pattern` (a regular expression for the 
+    job name, e.g. '^worker-') are ever removed. Without it, nothing is.
+    """
+
+    def __init__(self, init_path=DEFAULT_INIT_PATH, prune_pattern=None):
+        self.__init_path = init_path
+        self.__prune_re = re.compile(prune_pattern) \
+                            if prune_pattern is not None \
+                            else None
+
+        # Job names to rendered content.
+        self.__jobs = {}
+
+    def add(self, name, jb):
+        """Add a job as a builder (or anything else that renders via str(), 
+        such as a template's output).
+        """
+
+        if _NAME_RE.match(name) is None:
+            raise ValueError("Job name is not valid: %s" % (name))
+
+        self.__jobs[name] = str(jb)
+        return self
+
+    def __get_filepath(self, name):
+        return join(self.__init_path, name + '.conf')
+
+    def __is_current(self, filepath, content):
+        try:
+            size = os.path.getsize(filepath)
+        except OSError:
+            return False
+
+        # Only read the files whose sizes match.
+        if size != len(content):
+            return False
+
+        with open(filepath, 'rb') as f:
+            return f.read() == content
+
+    def plan(self):
+        to_write = {}
+        unchanged = []
+
+        for name, content in self.__jobs.iteritems():
+            if self.__is_current(self.__get_filepath(name), content) is True:
+                unchanged.append(name)
+            else:
+                to_write[name] = content
+
+        to_remove = []
+        if self.__prune_re is not None:
+            for filename in os.listdir(self.__init_path):
+                if filename.endswith('.conf') is False:
+                    continue
+
+                name = filename[:-len('.conf')]
+                if name not in self.__jobs and \
+                   self.__prune_re.search(name) is not None:
+                    to_remove.append(name)
+
+        return JobSetPlan(to_write, sorted(to_remove), sorted(unchanged))
+
+    def apply(self, reload=True):
+        """Apply the changes and return the plan that was carried out."""
+
+        plan = self.plan()
+
+        # Every file is in place (and durable) before the reload.
+        with AtomicJobWriter() as w:
+            for name, content in plan.to_write.iteritems():
+                w.write(self.__get_filepath(name), content)
+
+            for name in plan.to_remove:
+                w.remove(self.__get_filepath(name))
+
+        if reload is True and plan.is_changed is True:
+            # Merged with any other writers' reloads, if a coordinator is 
+            # running.
+            request_reload()
+            plan.reloaded = True
+
+        return plan
@@ -0,0 +1,120 @@
+from cStringIO import StringIO
+
+
+def _intern(value):
+    """Intern a string value (a Unicode one is kept as it is). Interned
+    strings are still freed once nothing refers to them.
+    """
+
+    if issubclass(value.__class__, str) is True:
+        return intern(value)
+
+    return value
+
+
+class JobSpec(object):
+    """An immutable, hashable snapshot of a job's stanzas, for holding very
+    many jobs in memory. Stanza types and values are interned, so they're
+    shared with every other spec that has the same ones.
+
+    Specs compare by their stanzas (in order), so they can be deduplicated in
+    sets and dictionaries. Use JobBuilder.to_spec() to make one, and
+    JobBuilder.from_stanzas(spec.stanzas) to go back.
+    """
+
+    __slots__ = ('__stanzas', '__hash')
+
+    def __init__(self, stanzas, pool=None):
+        """`stanzas` is an iterable of (stanza type, list of raw values)
+        tuples. `pool` is an optional dictionary for the specs of one 
+        collection (e.g. those being loaded together), through which their 
+        identical stanzas are stored once. It's freed along with them.
+        """
+
+        def share(value):
+            if pool is None:
+                return value
+
+            return pool.setdefault(value, value)
+
+        shared = []
+        for (stanza_type, values) in stanzas:
+            values = share(tuple([_intern(value) for value in values]))
+            shared.append(share((_intern(stanza_type), values)))
+
+        object.__setattr__(self, '_JobSpec__stanzas', share(tuple(shared)))
+        object.__setattr__(self, '_JobSpec__hash', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("JobSpec is immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError("JobSpec is immutable.")
+
+    def __getstate__(self):
+        return self.__stanzas
+
+    def __setstate__(self, stanzas):
+        self.__init__(stanzas)
+
+    @property
+    def stanzas(self):
+        """A tuple of (stanza type, tuple of raw values) tuples."""
+
+        return self.__stanzas
+
+    def get(self, stanza_type, default=None):
+        """Return the tuple of raw values for a stanza type."""
+
+        for (current_type, values) in self.__stanzas:
+            if current_type == stanza_type:
+                return values
+
+        return default
+
+    def __contains__(self, stanza_type):
+        return self.get(stanza_type) is not None
+
+    def __len__(self):
+        return len(self.__stanzas)
+
+    def __hash__(self):
+        if self.__hash is None:
+            object.__setattr__(self, '_JobSpec__hash', hash(self.__stanzas))
+
+        return self.__hash
+
+    def __eq__(self, o):
+        if self is o:
+            return True
+
+        if issubclass(o.__class__, JobSpec) is False:
+            return NotImplemented
+
+        # Shared tuples usually make this an identity check.
+        return self.__stanzas is o.__stanzas or \
+               (hash(self) == hash(o) and self.__stanzas == o.__stanzas)
+
+    def __ne__(self, o):
+        result = self.__eq__(o)
+        if result is NotImplemented:
+            return result
+
+        return not result
+
+    def write(self, f):
+        for (stanza_type, values) in self.__stanzas:
+            for value in values:
+                f.write(stanza_type)
+                f.write(' ')
+                f.write(value)
+                f.write("\n")
+
+    def __str__(self):
+        s = StringIO()
+        self.write(s)
+
+        return s.getvalue()
+
+    def __repr__(self):
+        return ('<JobSpec stanzas=%d>' % (len(self.__stanzas)))
@@ -0,0 +1,133 @@
+import bisect
+import re
+
+from cStringIO import StringIO
+
+from upstart.job_builder import escape
+from upstart.job_writer import AtomicJobWriter
+
+_PLACEHOLDER_RE = re.compile(r'\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}')
+
+# The stanzas whose values the builder quotes (and escapes).
+_QUOTED_STANZAS = ('description', 'author', 'version', 'usage')
+
+_SCRIPT_START_RE = re.compile(r'^((pre|post)-(start|stop) )?script$')
+
+
+class JobTemplate(object):
+    """A job compiled once from a JobBuilder whose values contain "{{name}}"
+    placeholders (e.g. jb.env('PORT', '{{port}}')). Stamping out a job just
+    interleaves the compiled, literal text with the given values.
+
+    Values that land in a quoted stanza (description, author, version, or 
+    usage) are escaped the same way that the builder escapes; all others 
+    (e.g. in an exec line or a script) are inserted exactly as given.
+    """
+
+    def __init__(self, jb):
+        text = str(jb)
+
+        parts = _PLACEHOLDER_RE.split(text)
+
+        # Literal text alternates with placeholder names.
+        self.__literals = parts[0::2]
+        self.__names = parts[1::2]
+        self.__quoted = self.__find_quoted(text)
+
+        self.__variables = frozenset(self.__names)
+
+    def __find_quoted(self, text):
+        """Determine which placeholders are in the value of a quoted stanza.
+        Script blocks are skipped, since their lines aren't stanzas.
+        """
+
+        # The offset that each line starts at, and whether it's a quoted
+        # stanza.
+        line_offsets = []
+        line_quoted = []
+
+        offset = 0
+        in_script = False
+
+        for line in text.split("\n"):
+            stripped = line.strip()
+
+            if in_script is True:
+                is_quoted = False
+                if stripped == 'end script':
+                    in_script = False
+            else:
+                is_quoted = stripped.split(' ', 1)[0] in _QUOTED_STANZAS
+                if _SCRIPT_START_RE.match(stripped) is not None:
+                    in_script = True
+
+            line_offsets.append(offset)
+            line_quoted.append(is_quoted)
+
+            offset += len(line) + 1
+
+        return [line_quoted[bisect.bisect_right(line_offsets, m.start()) - 1]
+                for m
+                in _PLACEHOLDER_RE.finditer(text)]
+
+    @property
+    def variables(self):
+        return self.__variables
+
+    def __iter_pieces(self, values):
+        literals = self.__literals
+
+        yield literals[0]
+
+        for i, name in enumerate(self.__names):
+            try:
+                value = values[name]
+            except KeyError:
+                raise ValueError("No value for template variable: %s" %
+                                 (name))
+
+            value = str(value)
+            if self.__quoted[i] is True:
+                value = escape(value)
+
+            yield value
+            yield literals[i + 1]
+
+    def render(self, values):
+        """Return the job for a dictionary of variable values."""
+
+        return ''.join(self.__iter_pieces(values))
+
+    def write(self, f, values):
+        """Write the job for a dictionary of variable values to a file-like
+        object.
+        """
+
+        for piece in self.__iter_pieces(values):
+            f.write(piece)
+
+    def render_many(self, values_list, f=None):
+        """Render a job per dictionary of values, back to back, into one
+        file-like object. If `f` isn't given, render into a new buffer and
+        return its contents.
+        """
+
+        if f is None:
+            s = StringIO()
+            self.render_many(values_list, s)
+
+            return s.getvalue()
+
+        for values in values_list:
+            self.write(f, values)
+
+    def write_many(self, jobs):
+        """Write each of an iterable of (filepath, values) tuples to its own
+        file, as the iterable is consumed. The files are written atomically,
+        and synced together.
+        """
+
+        with AtomicJobWriter() as w:
+            for (filepath, values) in jobs:
+                w.write(filepath,
+                        lambda f, values=values: self.write(f, values))
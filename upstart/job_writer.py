@@ -0,0 +1,131 @@
+import errno
+import os
+import tempfile
+
+from os.path import basename, dirname, abspath
+
+_JOB_FILE_MODE = 0o644
+
+# Only the file's data (and the metadata needed to read it) has to be 
+# flushed, not its timestamps.
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+
+def _fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class AtomicJobWriter(object):
+    """Writes job files crash-safely and in bulk. Each file is written to a
+    temporary file beside it (whose name doesn't end in ".conf", so Upstart
+    ignores it), and nothing is renamed into place until commit().
+
+    Each temporary file's data is flushed (with fdatasync()) as it's 
+    written. On commit, the files are renamed into place, and each directory
+    is fsync'd once to make the renames durable.
+    """
+
+    def __init__(self, fsync=True):
+        self.__fsync = fsync
+
+        # (Temporary path, final path) tuples.
+        self.__pending = []
+        self.__removals = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        if type_ is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def write(self, filepath, data):
+        """Stage a file. `data` is a string, an object with a write(f) method
+        (e.g. a JobBuilder), or a callable that takes the file.
+        """
+
+        filepath = abspath(filepath)
+
+        (fd, temp_filepath) = tempfile.mkstemp(
+                                prefix=('.%s.' % (basename(filepath))),
+                                suffix='.tmp',
+                                dir=dirname(filepath))
+
+        try:
+            try:
+                os.fchmod(fd, _JOB_FILE_MODE)
+                f = os.fdopen(fd, 'w')
+            except:
+                os.close(fd)
+                raise
+
+            with f:
+                if hasattr(data, 'write') is True:
+                    data.write(f)
+                elif callable(data) is True:
+                    data(f)
+                else:
+                    f.write(data)
+
+                if self.__fsync is True:
+                    f.flush()
+                    _fdatasync(f.fileno())
+        except:
+            os.unlink(temp_filepath)
+            raise
+
+        self.__pending.append((temp_filepath, filepath))
+
+    def remove(self, filepath):
+        """Stage the removal of a file (done after the writes, on commit)."""
+
+        self.__removals.append(abspath(filepath))
+
+    def commit(self):
+        """Put all of the staged files into place, and return the number of
+        files written.
+        """
+
+        directories = set()
+
+        for (temp_filepath, filepath) in self.__pending:
+            os.rename(temp_filepath, filepath)
+            directories.add(dirname(filepath))
+
+        for filepath in self.__removals:
+            try:
+                os.unlink(filepath)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+            directories.add(dirname(filepath))
+
+        if self.__fsync is True:
+            for directory in directories:
+                _fsync_path(directory)
+
+        count = len(self.__pending)
+
+        del self.__pending[:]
+        del self.__removals[:]
+
+        return count
+
+    def abort(self):
+        """Discard all of the staged files."""
+
+        for (temp_filepath, _) in self.__pending:
+            try:
+                os.unlink(temp_filepath)
+            except OSError:
+                pass
+
+        del self.__pending[:]
+        del self.__removals[:]
@@ -0,0 +1,80 @@
+"""Upstart escapes job and instance names when it uses them as D-Bus object-
+path elements: letters and digits are kept, and every other byte becomes an
+underscore followed by two lowercase hex digits (e.g. "avahi-daemon" becomes
+"avahi_2ddaemon"). An empty name (the default instance) becomes "_".
+"""
+
+import re
+
+_ESCAPE_RE = re.compile('_([0-9a-f]{2})')
+
+# The memo is dropped wholesale if it gets this big, rather than tracking use.
+_MAX_MEMO_SIZE = 100000
+
+
+class NameCodec(object):
+    """Encodes and decodes names, remembering the translations it has done.
+    Each direction has its own memo, so a decoded element (which may not be
+    escaped the way that encode() would do it, e.g. "_41" for "A") is never
+    handed back by encode().
+
+    Unicode names are escaped as their UTF-8 bytes, as Upstart does.
+    """
+
+    def __init__(self, max_size=_MAX_MEMO_SIZE):
+        self.__max_size = max_size
+        self.__encoded = {}
+        self.__decoded = {}
+
+    def __remember(self, memo, key, value):
+        if len(memo) >= self.__max_size:
+            memo.clear()
+
+        memo[key] = value
+
+    def encode(self, name):
+        try:
+            return self.__encoded[name]
+        except KeyError:
+            pass
+
+        if issubclass(name.__class__, unicode) is True:
+            raw = name.encode('utf-8')
+        else:
+            raw = name
+
+        if not raw:
+            element = '_'
+        else:
+            element = ''.join([c 
+                               if c.isalnum() and ord(c) < 128 
+                               else ('_%02x' % ord(c))
+                               for c 
+                               in raw])
+
+        self.__remember(self.__encoded, name, element)
+        return element
+
+    def decode(self, element):
+        try:
+            return self.__decoded[element]
+        except KeyError:
+            pass
+
+        if element == '_':
+            name = ''
+        else:
+            name = _ESCAPE_RE.sub(lambda m: chr(int(m.group(1), 16)), element)
+
+        self.__remember(self.__decoded, element, name)
+        return name
+
+_codec = NameCodec()
+
+
+def encode_name(name):
+    return _codec.encode(name)
+
+
+def decode_name(element):
+    return _codec.decode(element)
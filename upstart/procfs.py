@@ -0,0 +1,110 @@
+import errno
+import os
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+PROC_PATH = '/proc'
+
+
+def _read(filepath):
+    """Return the contents of a /proc file, or None if the process is gone
+    (or the file isn't readable).
+    """
+
+    try:
+        with open(filepath, 'rb') as f:
+            return f.read()
+    except IOError as e:
+        if e.errno in (errno.ENOENT, errno.ESRCH, errno.EACCES):
+            return None
+
+        raise
+
+
+def parse_stat(text):
+    """Return the fields of /proc/<pid>/stat, after the command (which may
+    contain spaces and parentheses), so that field N of proc(5) is at index
+    N - 3.
+    """
+
+    return text[text.rfind(')') + 2:].split()
+
+
+class ProcessUsage(object):
+    """Cumulative counters of one process. The IO counters are None if
+    /proc/<pid>/io isn't readable (it needs the same user, or root).
+    """
+
+    __slots__ = ('pid', 'ppid', 'cpu_s', 'rss_bytes', 'read_bytes',
+                 'write_bytes')
+
+    def __init__(self, pid, ppid, cpu_s, rss_bytes, read_bytes=None,
+                 write_bytes=None):
+        self.pid = pid
+        self.ppid = ppid
+        self.cpu_s = cpu_s
+        self.rss_bytes = rss_bytes
+        self.read_bytes = read_bytes
+        self.write_bytes = write_bytes
+
+    def __repr__(self):
+        return ('<ProcessUsage %d cpu=%.2fs rss=%d>' %
+                (self.pid, self.cpu_s, self.rss_bytes))
+
+
+def read_process(pid, proc_path=PROC_PATH, with_io=True):
+    """Read a process's stat and (optionally) io files. Returns a
+    ProcessUsage, or None if the process is gone.
+    """
+
+    prefix = ('%s/%d/' % (proc_path, pid))
+
+    text = _read(prefix + 'stat')
+    if text is None:
+        return None
+
+    fields = parse_stat(text)
+
+    # ppid, utime and stime (in ticks), and rss (in pages).
+    usage = ProcessUsage(pid,
+                         int(fields[1]),
+                         float(int(fields[11]) + int(fields[12])) /
+                            CLOCK_TICKS,
+                         int(fields[21]) * PAGE_SIZE)
+
+    if with_io is True:
+        text = _read(prefix + 'io')
+        if text is not None:
+            for line in text.splitlines():
+                (key, _, value) = line.partition(':')
+                if key == 'read_bytes':
+                    usage.read_bytes = int(value)
+                elif key == 'write_bytes':
+                    usage.write_bytes = int(value)
+
+    return usage
+
+
+def iter_pids(proc_path=PROC_PATH):
+    for name in os.listdir(proc_path):
+        if name.isdigit() is True:
+            yield int(name)
+
+
+def read_processes(pids=None, proc_path=PROC_PATH, with_io=True):
+    """Read many processes (or every process) in one pass. Returns a
+    dictionary of PIDs to ProcessUsages, without the processes that are
+    gone.
+    """
+
+    if pids is None:
+        pids = iter_pids(proc_path)
+
+    processes = {}
+    for pid in pids:
+        usage = read_process(pid, proc_path=proc_path, with_io=with_io)
+        if usage is not None:
+            processes[pid] = usage
+
+    return processes
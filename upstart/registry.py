@@ -0,0 +1,194 @@
+import bisect
+import fnmatch
+import re
+import threading
+
+from upstart.bus import get_bus, dispatch_pending, UPSTART_BUS_NAME, \
+                        UPSTART_OBJECT_PATH, UPSTART_INTERFACE
+from upstart.job import UpstartJob
+from upstart.names import encode_name, decode_name
+
+_WILDCARD_RE = re.compile(r'[*?\[]')
+
+
+def _get_prefix_upper_bound(prefix):
+    """Return the least string that's greater than every string starting with
+    `prefix`, or None if there isn't one (e.g. for an empty prefix).
+    """
+
+    prefix = prefix.rstrip('\xff')
+    if not prefix:
+        return None
+
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class JobRegistry(object):
+    """An index of every job by its real (decoded) name, e.g. "avahi-daemon"
+    rather than "avahi_2ddaemon". The jobs are enumerated once, and then
+    JobAdded/JobRemoved keep the index current.
+
+    As with JobStateCache, signals are dispatched while the GLib main-context
+    is iterated (which every query does, without blocking).
+    """
+
+    def __init__(self, bus=None):
+        self.__bus = bus if bus is not None else get_bus()
+        self.__lock = threading.RLock()
+
+        # Real name to path element.
+        self.__elements = {}
+
+        # Sorted real names, for prefix-queries.
+        self.__names = []
+
+        self.__receivers = []
+
+    def start(self):
+        if self.__receivers:
+            return self
+
+        connection = self.__bus.connection
+
+        for (handler, signal_name) in ((self.__job_added, 'JobAdded'),
+                                       (self.__job_removed, 'JobRemoved')):
+            receiver = connection.add_signal_receiver(
+                        handler,
+                        signal_name=signal_name,
+                        dbus_interface=UPSTART_INTERFACE,
+                        bus_name=UPSTART_BUS_NAME,
+                        path=UPSTART_OBJECT_PATH)
+
+            self.__receivers.append(receiver)
+
+        upstart_i = self.__bus.get_interface(
+                        UPSTART_OBJECT_PATH,
+                        UPSTART_INTERFACE)
+
+        with self.__lock:
+            for job_path in upstart_i.GetAllJobs(signature=''):
+                self.__add(job_path)
+
+        return self
+
+    def close(self):
+        for receiver in self.__receivers:
+            receiver.remove()
+
+        del self.__receivers[:]
+
+        with self.__lock:
+            self.__elements.clear()
+            del self.__names[:]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type_, value, traceback):
+        self.close()
+
+    def process_events(self):
+        dispatch_pending(self.__bus)
+
+    def __add(self, job_path):
+        element = str(job_path[job_path.rfind('/') + 1:])
+        name = decode_name(element)
+
+        if name not in self.__elements:
+            bisect.insort(self.__names, name)
+
+        self.__elements[name] = element
+
+    def __job_added(self, job_path):
+        with self.__lock:
+            self.__add(job_path)
+
+    def __job_removed(self, job_path):
+        name = decode_name(str(job_path[job_path.rfind('/') + 1:]))
+
+        with self.__lock:
+            if self.__elements.pop(name, None) is None:
+                return
+
+            i = bisect.bisect_left(self.__names, name)
+            del self.__names[i]
+
+        self.__bus.invalidate(job_path)
+
+    def __contains__(self, name):
+        self.process_events()
+
+        with self.__lock:
+            return name in self.__elements
+
+    def __len__(self):
+        self.process_events()
+
+        with self.__lock:
+            return len(self.__names)
+
+    def get_names(self):
+        """Return all of the (real) job names, sorted."""
+
+        self.process_events()
+
+        with self.__lock:
+            return list(self.__names)
+
+    def get_element(self, name):
+        """Return the escaped name that UpstartJob and get_all_jobs() use."""
+
+        self.process_events()
+
+        with self.__lock:
+            try:
+                return self.__elements[name]
+            except KeyError:
+                raise KeyError("Job not registered: %s" % (name))
+
+    def get_job(self, name):
+        return UpstartJob(self.get_element(name), bus=self.__bus)
+
+    def find_prefix(self, prefix):
+        """Return the sorted names that start with `prefix`."""
+
+        # The names are kept as the (UTF-8) bytes that Upstart has.
+        if issubclass(prefix.__class__, unicode) is True:
+            prefix = prefix.encode('utf-8')
+
+        self.process_events()
+
+        with self.__lock:
+            i = bisect.bisect_left(self.__names, prefix)
+
+            upper = _get_prefix_upper_bound(prefix)
+            if upper is None:
+                j = len(self.__names)
+            else:
+                j = bisect.bisect_left(self.__names, upper, i)
+
+            return self.__names[i:j]
+
+    def match(self, pattern):
+        """Return the sorted names that match a shell-style pattern (e.g.
+        "worker-*"). Only the names that share the pattern's literal prefix
+        are checked.
+        """
+
+        m = _WILDCARD_RE.search(pattern)
+        if m is None:
+            return [pattern] if pattern in self else []
+
+        candidates = self.find_prefix(pattern[:m.start()])
+        return [name
+                for name
+                in candidates
+                if fnmatch.fnmatchcase(name, pattern)]
+
+
+def get_job_by_name(name, bus=None):
+    """Return an UpstartJob for a real job name (e.g. "avahi-daemon"), without
+    a registry.
+    """
+
+    return UpstartJob(encode_name(name), bus=bus)
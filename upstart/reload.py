@@ -0,0 +1,246 @@
+import errno
+import os
+import select
+import signal
+import socket
+import time
+
+DEFAULT_SOCKET_PATH = '/var/run/upstart-reload.sock'
+DEFAULT_WINDOW_S = 0.5
+DEFAULT_REQUEST_TIMEOUT_S = 30.0
+
+_REQUEST = 'reload'
+_MAX_LINE_LENGTH = 64
+
+
+def reload_configuration():
+    """Have Upstart reread its job configuration, over D-Bus if possible and 
+    otherwise by sending SIGHUP to init.
+    """
+
+    try:
+        from upstart.system import UpstartSystem
+
+        UpstartSystem().reload_configuration()
+    except Exception:
+        os.kill(1, signal.SIGHUP)
+
+
+class ReloadCoordinator(object):
+    """Serves reload requests on a Unix socket, and merges all of those that
+    arrive within a window of the first into one configuration reload (over
+    D-Bus, or SIGHUP). Each client is told how many requests its reload
+    covered once it's done.
+
+    A request that arrives while a reload is underway gets the next one, so
+    nobody's changes are missed.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH,
+                 window_s=DEFAULT_WINDOW_S, reload_=reload_configuration):
+        self.__socket_path = socket_path
+        self.__window_s = window_s
+        self.__reload = reload_
+
+        self.__listener = None
+        self.__is_running = False
+
+        # Connections that haven't sent a full request, to their input.
+        self.__reading = {}
+
+        # Connections that are waiting for the reload.
+        self.__waiting = []
+        self.__deadline = None
+
+        self.__reloads = 0
+        self.__requests = 0
+
+    @property
+    def reloads(self):
+        return self.__reloads
+
+    @property
+    def requests(self):
+        return self.__requests
+
+    def __listen(self):
+        if os.path.exists(self.__socket_path) is True:
+            # Only a socket that nothing is serving on is replaced.
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.__socket_path)
+            except socket.error as e:
+                if e.errno != errno.ECONNREFUSED:
+                    raise
+
+                os.unlink(self.__socket_path)
+            else:
+                raise EnvironmentError("A reload coordinator is already "
+                                       "running: %s" % (self.__socket_path))
+            finally:
+                probe.close()
+
+        self.__listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__listener.bind(self.__socket_path)
+        self.__listener.listen(128)
+
+    def __accept(self):
+        (connection, _) = self.__listener.accept()
+        self.__reading[connection] = ''
+
+    def __read(self, connection):
+        try:
+            data = connection.recv(_MAX_LINE_LENGTH)
+        except socket.error:
+            data = ''
+
+        if not data:
+            del self.__reading[connection]
+            connection.close()
+            return
+
+        buffered = self.__reading[connection] + data
+        if "\n" not in buffered:
+            if len(buffered) >= _MAX_LINE_LENGTH:
+                del self.__reading[connection]
+                connection.close()
+            else:
+                self.__reading[connection] = buffered
+
+            return
+
+        del self.__reading[connection]
+
+        if buffered.split("\n", 1)[0].strip() != _REQUEST:
+            self.__reply([connection], "error Unknown request.\n")
+            return
+
+        self.__waiting.append(connection)
+        self.__requests += 1
+
+        if self.__deadline is None:
+            self.__deadline = time.time() + self.__window_s
+
+    def __reply(self, connections, message):
+        for connection in connections:
+            try:
+                connection.sendall(message)
+            except socket.error:
+                pass
+            finally:
+                connection.close()
+
+    def __do_reload(self):
+        waiting = self.__waiting
+        self.__waiting = []
+        self.__deadline = None
+
+        try:
+            self.__reload()
+        except Exception as e:
+            message = ('error %s\n' % (str(e).replace("\n", ' ')))
+        else:
+            self.__reloads += 1
+            message = ('ok %d\n' % (len(waiting)))
+
+        self.__reply(waiting, message)
+
+    def step(self, timeout_s=None):
+        """Handle whatever's ready, waiting at most `timeout_s` (or until the
+        current window closes, if sooner).
+        """
+
+        if self.__deadline is not None:
+            remaining_s = max(0, self.__deadline - time.time())
+            if timeout_s is None or remaining_s < timeout_s:
+                timeout_s = remaining_s
+
+        readable = [self.__listener] + list(self.__reading.keys())
+
+        try:
+            (ready, _, _) = select.select(readable, [], [], timeout_s)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+
+            ready = []
+
+        for s in ready:
+            if s is self.__listener:
+                self.__accept()
+            else:
+                self.__read(s)
+
+        if self.__deadline is not None and time.time() >= self.__deadline:
+            self.__do_reload()
+
+    def serve_forever(self):
+        self.__listen()
+        self.__is_running = True
+
+        try:
+            while self.__is_running is True:
+                self.step(timeout_s=1.0)
+        finally:
+            self.close()
+
+    def stop(self):
+        self.__is_running = False
+
+    def close(self):
+        self.__reply(list(self.__reading.keys()) + self.__waiting,
+                     "error Coordinator stopped.\n")
+
+        self.__reading = {}
+        self.__waiting = []
+        self.__deadline = None
+
+        if self.__listener is not None:
+            self.__listener.close()
+            self.__listener = None
+
+            try:
+                os.unlink(self.__socket_path)
+            except OSError:
+                pass
+
+
+def request_reload(socket_path=DEFAULT_SOCKET_PATH,
+                   timeout_s=DEFAULT_REQUEST_TIMEOUT_S):
+    """Ask the coordinator for a reload, and wait for it to happen. Returns
+    the number of requests that the reload covered. If no coordinator is
+    running, reload directly (and return 1).
+    """
+
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(timeout_s)
+
+    try:
+        try:
+            s.connect(socket_path)
+        except socket.error as e:
+            if e.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+                raise
+
+            reload_configuration()
+            return 1
+
+        s.sendall(_REQUEST + "\n")
+
+        response = ''
+        while "\n" not in response:
+            data = s.recv(1024)
+            if not data:
+                break
+
+            response += data
+    finally:
+        s.close()
+
+    (status, _, detail) = response.strip().partition(' ')
+
+    if status != 'ok':
+        raise EnvironmentError("Reload failed: %s" %
+                               (detail or "No response."))
+
+    return int(detail)
@@ -0,0 +1,437 @@
+import array
+import time
+
+from upstart.procfs import read_processes, PROC_PATH
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_HISTORY_SIZE = 60
+
+# The columns of each job's history. The counters are cumulative over the
+# job's processes (see JobSampler).
+FIELDS = ('time', 'cpu_s', 'rss_bytes', 'read_bytes', 'write_bytes')
+
+# The counters that rates are computed from: (field, rate, scale).
+_RATE_FIELDS = (('cpu_s', 'cpu_percent', 100.0),
+                ('read_bytes', 'read_bps', 1.0),
+                ('write_bytes', 'write_bps', 1.0))
+
+
+class _HistoryTable(object):
+    """The histories of every job in one NumPy array (of slots, rows, and
+    FIELDS), with each slot's position and count in arrays alongside, so that
+    every job's rates are computed together.
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+        self.rows = numpy.zeros((0, size, len(FIELDS)), dtype=numpy.float64)
+        self.next = numpy.zeros(0, dtype=numpy.intp)
+        self.count = numpy.zeros(0, dtype=numpy.intp)
+
+        self.__free = []
+
+    def allocate(self):
+        if not self.__free:
+            used = len(self.count)
+            capacity = max(8, used * 2)
+
+            rows = numpy.zeros((capacity, self.size, len(FIELDS)),
+                               dtype=numpy.float64)
+            rows[:used] = self.rows
+            self.rows = rows
+
+            self.next = numpy.resize(self.next, capacity)
+            self.count = numpy.resize(self.count, capacity)
+
+            self.__free.extend(reversed(xrange(used, capacity)))
+
+        slot = self.__free.pop()
+        self.next[slot] = 0
+        self.count[slot] = 0
+
+        return slot
+
+    def release(self, slot):
+        self.__free.append(slot)
+
+    def get_rates(self, slots, window):
+        """Return a (values, windows, has_rates) tuple: a dictionary of the 
+        values of JobSampler.get_rates() to arrays with one per slot, the 
+        number of rows that each slot's values cover, and whether each 
+        slot's rates are defined.
+        """
+
+        slots = numpy.asarray(slots, dtype=numpy.intp)
+        count = self.count[slots]
+        next_ = self.next[slots]
+
+        window = count if window is None else numpy.minimum(count, window)
+
+        # Every row is in the window if the buffer isn't full yet, since its
+        # position is then its count.
+        first = (next_ - window) % self.size
+        last = (next_ - 1) % self.size
+
+        rows = self.rows[slots]
+        indices = numpy.arange(len(slots))
+
+        first_rows = rows[indices, first]
+        last_rows = rows[indices, last]
+
+        in_window = ((numpy.arange(self.size)[numpy.newaxis, :] -
+                      first[:, numpy.newaxis]) % self.size) < \
+                    window[:, numpy.newaxis]
+
+        rss_column = FIELDS.index('rss_bytes')
+        time_column = FIELDS.index('time')
+
+        rss_sum = (rows[:, :, rss_column] * in_window).sum(axis=1)
+        elapsed_s = last_rows[:, time_column] - first_rows[:, time_column]
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            rates = { 'rss_bytes': last_rows[:, rss_column],
+                      'rss_mean_bytes': rss_sum / window }
+
+            for (field, key, scale) in _RATE_FIELDS:
+                column = FIELDS.index(field)
+                rates[key] = (last_rows[:, column] - first_rows[:, column]) / \
+                             elapsed_s * scale
+
+        return (rates, window, (window >= 2) & (elapsed_s > 0))
+
+
+class _RingBuffer(object):
+    """A fixed number of rows of FIELDS, overwritten oldest-first. The rows
+    are kept in typed arrays (or a slot of a _HistoryTable, if NumPy is being
+    used), so the history of a job never grows.
+    """
+
+    def __init__(self, size, table=None):
+        self.__size = size
+        self.__table = table
+
+        if table is not None:
+            self.slot = table.allocate()
+        else:
+            self.__columns = [array.array('d', [0.0]) * size
+                              for _
+                              in FIELDS]
+
+            self.__next = 0
+            self.__count = 0
+
+    def __len__(self):
+        if self.__table is not None:
+            return int(self.__table.count[self.slot])
+
+        return self.__count
+
+    def close(self):
+        if self.__table is not None:
+            self.__table.release(self.slot)
+
+    def append(self, row):
+        if self.__table is not None:
+            table = self.__table
+            slot = self.slot
+
+            table.rows[slot, table.next[slot]] = row
+            table.next[slot] = (table.next[slot] + 1) % self.__size
+            table.count[slot] = min(table.count[slot] + 1, self.__size)
+        else:
+            i = self.__next
+            for (column, value) in zip(self.__columns, row):
+                column[i] = value
+
+            self.__next = (i + 1) % self.__size
+            self.__count = min(self.__count + 1, self.__size)
+
+    def get_column(self, field):
+        """Return a column, oldest first (as a NumPy array, if it's being
+        used, or otherwise a list).
+        """
+
+        i = FIELDS.index(field)
+
+        if self.__table is not None:
+            table = self.__table
+            count = table.count[self.slot]
+            column = table.rows[self.slot, :, i]
+
+            if count < self.__size:
+                return column[:count].copy()
+
+            start = table.next[self.slot]
+            return numpy.concatenate((column[start:], column[:start]))
+        else:
+            column = self.__columns[i]
+            if self.__count < self.__size:
+                return column[:self.__count].tolist()
+
+            start = self.__next
+            return (column[start:] + column[:start]).tolist()
+
+
+class _JobCounters(object):
+    """Totals of a job's processes that only go up, even as its processes
+    come and go: each process only contributes what it used while it was
+    being watched.
+    """
+
+    __slots__ = ('cpu_s', 'read_bytes', 'write_bytes', 'last')
+
+    def __init__(self):
+        self.cpu_s = 0.0
+        self.read_bytes = 0.0
+        self.write_bytes = 0.0
+
+        # PIDs to their last ProcessUsage.
+        self.last = {}
+
+
+class JobSampler(object):
+    """Samples the CPU, RSS, and IO of every job's processes from /proc, in
+    one pass per call to sample(), and keeps a fixed-size history per job.
+
+    If `include_children` is True, each job also gets the descendants of its
+    processes (e.g. the workers of a server). That reads every process on
+    the host (to find their parents), rather than just the jobs' PIDs.
+
+    If `use_numpy` is None, NumPy is used if it's installed.
+    """
+
+    def __init__(self, history_size=DEFAULT_HISTORY_SIZE,
+                 include_children=False, with_io=True, use_numpy=None,
+                 proc_path=PROC_PATH):
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        elif use_numpy is True and numpy is None:
+            raise ValueError("NumPy is not installed.")
+
+        self.__history_size = history_size
+        self.__include_children = include_children
+        self.__with_io = with_io
+        self.__proc_path = proc_path
+
+        self.__table = _HistoryTable(history_size) \
+                        if use_numpy is True \
+                        else None
+
+        # Job names to _RingBuffers and _JobCounters.
+        self.__histories = {}
+        self.__counters = {}
+
+    @property
+    def job_names(self):
+        return list(self.__histories.keys())
+
+    def __get_descendants(self, processes, job_pids):
+        children = {}
+        for usage in processes.itervalues():
+            children.setdefault(usage.ppid, []).append(usage.pid)
+
+        expanded = {}
+        for job_name, pids in job_pids.iteritems():
+            found = []
+            pending = list(pids)
+
+            while pending:
+                pid = pending.pop()
+                if pid not in processes:
+                    continue
+
+                found.append(pid)
+                pending.extend(children.get(pid, ()))
+
+            expanded[job_name] = found
+
+        return expanded
+
+    def sample(self, job_pids, now=None):
+        """Take a sample, given a dictionary of job names to their PIDs. Jobs
+        that aren't given are forgotten.
+        """
+
+        if now is None:
+            now = time.time()
+
+        if self.__include_children is True:
+            processes = read_processes(proc_path=self.__proc_path,
+                                       with_io=self.__with_io)
+
+            job_pids = self.__get_descendants(processes, job_pids)
+        else:
+            all_pids = set()
+            for pids in job_pids.itervalues():
+                all_pids.update(pids)
+
+            processes = read_processes(all_pids,
+                                       proc_path=self.__proc_path,
+                                       with_io=self.__with_io)
+
+        for job_name in list(self.__histories.keys()):
+            if job_name not in job_pids:
+                self.__histories.pop(job_name).close()
+                del self.__counters[job_name]
+
+        for job_name, pids in job_pids.iteritems():
+            try:
+                history = self.__histories[job_name]
+                counters = self.__counters[job_name]
+            except KeyError:
+                history = _RingBuffer(self.__history_size, self.__table)
+                counters = _JobCounters()
+
+                self.__histories[job_name] = history
+                self.__counters[job_name] = counters
+
+            rss_bytes = 0
+            current = {}
+
+            for pid in pids:
+                try:
+                    usage = processes[pid]
+                except KeyError:
+                    continue
+
+                rss_bytes += usage.rss_bytes
+                current[pid] = usage
+
+                last = counters.last.get(pid)
+                if last is None:
+                    continue
+
+                counters.cpu_s += max(0.0, usage.cpu_s - last.cpu_s)
+
+                if usage.read_bytes is not None and \
+                   last.read_bytes is not None:
+                    counters.read_bytes += \
+                        max(0, usage.read_bytes - last.read_bytes)
+
+                    counters.write_bytes += \
+                        max(0, usage.write_bytes - last.write_bytes)
+
+            counters.last = current
+
+            history.append((now, counters.cpu_s, rss_bytes,
+                            counters.read_bytes, counters.write_bytes))
+
+    def sample_statuses(self, statuses, now=None):
+        """Take a sample, given a dictionary of job names to lists of
+        statuses (JobStatuses or D-Bus dictionaries), as returned by
+        UpstartSystem.get_all_job_statuses().
+        """
+
+        job_pids = {}
+        for job_name, job_statuses in statuses.iteritems():
+            pids = []
+            for status in job_statuses:
+                if hasattr(status, 'pids') is True:
+                    pids.extend(status.pids)
+                else:
+                    pids.extend([int(pid)
+                                 for (_, pid)
+                                 in status['processes']])
+
+            job_pids[job_name] = pids
+
+        self.sample(job_pids, now=now)
+
+    def get_history(self, job_name):
+        """Return a dictionary of each of FIELDS to its values, oldest
+        first.
+        """
+
+        history = self.__histories[job_name]
+        return dict([(field, history.get_column(field))
+                     for field
+                     in FIELDS])
+
+    def get_rates(self, job_name, window=None):
+        """Return a dictionary of the job's CPU percentage, IO rates (bytes
+        per second), and current and mean RSS over the last `window`
+        samples (or the whole history). The rates are None until there are
+        two samples.
+        """
+
+        history = self.__histories[job_name]
+
+        if self.__table is not None:
+            return self.__get_table_rates([job_name], window)[job_name]
+
+        count = len(history)
+
+        if window is None or window > count:
+            window = count
+
+        times = history.get_column('time')[count - window:]
+        rss = history.get_column('rss_bytes')[count - window:]
+
+        rates = { 'rss_bytes': float(rss[-1]) if window > 0 else None,
+                  'rss_mean_bytes': (float(sum(rss)) / window)
+                                    if window > 0
+                                    else None,
+                  'cpu_percent': None,
+                  'read_bps': None,
+                  'write_bps': None }
+
+        if window < 2 or times[-1] <= times[0]:
+            return rates
+
+        elapsed_s = times[-1] - times[0]
+
+        for (field, key, scale) in _RATE_FIELDS:
+            column = history.get_column(field)
+            rates[key] = float(column[-1] - column[count - window]) / \
+                         elapsed_s * scale
+
+        return rates
+
+    def __get_table_rates(self, job_names, window):
+        """Compute the rates of many jobs at once, from the NumPy table."""
+
+        (values, windows, has_rates) = self.__table.get_rates(
+                                        [self.__histories[job_name].slot
+                                         for job_name
+                                         in job_names],
+                                        window)
+
+        # Plain floats (and Nones), as without NumPy.
+        values = dict([(key, column.tolist())
+                       for (key, column)
+                       in values.iteritems()])
+
+        windows = windows.tolist()
+        has_rates = has_rates.tolist()
+
+        summary = {}
+        for (i, job_name) in enumerate(job_names):
+            rates = dict([(key, None) for key in values])
+
+            if windows[i] > 0:
+                rates['rss_bytes'] = values['rss_bytes'][i]
+                rates['rss_mean_bytes'] = values['rss_mean_bytes'][i]
+
+            if has_rates[i] is True:
+                for (_, key, _) in _RATE_FIELDS:
+                    rates[key] = values[key][i]
+
+            summary[job_name] = rates
+
+        return summary
+
+    def summarize(self, window=None):
+        """Return a dictionary of every job's rates (see get_rates())."""
+
+        if self.__table is not None:
+            return self.__get_table_rates(list(self.__histories.keys()),
+                                          window)
+
+        return dict([(job_name, self.get_rates(job_name, window=window))
+                     for job_name
+                     in self.__histories])
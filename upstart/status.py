@@ -0,0 +1,119 @@
+try:
+    intern
+except NameError:
+    from sys import intern
+
+try:
+    unicode_ = unicode
+except NameError:
+    unicode_ = str
+
+# Pre-intern the strings that Upstart reports, so that every status shares
+# them.
+_NAMES = dict([(name, intern(name))
+               for name
+               in ('start', 'stop', 'waiting', 'starting', 'security',
+                   'tmpfiles', 'pre-start', 'spawned', 'post-start',
+                   'running', 'pre-stop', 'stopping', 'killed', 'post-stop',
+                   'main', '')])
+
+
+def _intern(value):
+    value = str(value)
+
+    try:
+        return _NAMES[value]
+    except KeyError:
+        return intern(value)
+
+
+class ProcessInfo(object):
+    __slots__ = ('name', 'pid')
+
+    def __init__(self, name, pid):
+        self.name = name
+        self.pid = pid
+
+    def __repr__(self):
+        return ('<ProcessInfo %s %d>' % (self.name, self.pid))
+
+    def __eq__(self, o):
+        return issubclass(o.__class__, ProcessInfo) is True and \
+               self.name == o.name and \
+               self.pid == o.pid
+
+    def __ne__(self, o):
+        return not self.__eq__(o)
+
+    def __hash__(self):
+        return hash((self.name, self.pid))
+
+
+class JobStatus(object):
+    """A decoded instance status. The name, goal, and state are plain
+    (interned) strings. The D-Bus process array is only converted the first
+    time that it's used.
+    """
+
+    __slots__ = ('job_name', 'name', 'goal', 'state', '__raw_processes',
+                 '__processes')
+
+    def __init__(self, job_name, name, goal, state, processes):
+        self.job_name = job_name
+        self.name = name
+        self.goal = goal
+        self.state = state
+
+        self.__raw_processes = processes
+        self.__processes = None
+
+    @classmethod
+    def from_dbus(cls, job_name, properties):
+        """Build from the dictionary that GetAll returns for an instance."""
+
+        return cls(_intern(job_name),
+                   unicode_(properties['name']),
+                   _intern(properties['goal']),
+                   _intern(properties['state']),
+                   properties['processes'])
+
+    @property
+    def processes(self):
+        if self.__processes is None:
+            self.__processes = tuple([ProcessInfo(_intern(name), int(pid))
+                                      for (name, pid)
+                                      in self.__raw_processes])
+
+            self.__raw_processes = None
+
+        return self.__processes
+
+    @property
+    def pids(self):
+        return [p.pid for p in self.processes]
+
+    def to_dict(self):
+        """Return a dictionary of standard types (e.g. for JSON)."""
+
+        return { 'job': self.job_name,
+                 'name': self.name,
+                 'goal': self.goal,
+                 'state': self.state,
+                 'processes': [[p.name, p.pid] for p in self.processes] }
+
+    def __repr__(self):
+        return ('<JobStatus %s/%s goal=%s state=%s>' %
+                (self.job_name, self.name, self.goal, self.state))
+
+    def __eq__(self, o):
+        return issubclass(o.__class__, JobStatus) is True and \
+               self.job_name == o.job_name and \
+               self.name == o.name and \
+               self.goal == o.goal and \
+               self.state == o.state and \
+               self.processes == o.processes
+
+    def __ne__(self, o):
+        return not self.__eq__(o)
+
+    __hash__ = None
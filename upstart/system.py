@@ -1,37 +1,207 @@
+from collections import deque
+
 import dbus
 
+from upstart.bus import get_bus, CallPipeline, UPSTART_OBJECT_PATH, \
+                        UPSTART_INTERFACE, JOB_INTERFACE, \
+                        PROPERTIES_INTERFACE, DEFAULT_MAX_IN_FLIGHT
+from upstart.status import JobStatus
+
+_EMPTY_ENV_LIST = dbus.Array([], signature='s')
+
+# Errors that just mean that a job or instance went away during a sweep.
+_VANISHED_ERRORS = ('org.freedesktop.DBus.Error.UnknownObject', 
+                    'org.freedesktop.DBus.Error.UnknownMethod', 
+                    'com.ubuntu.Upstart0_6.Error.UnknownInstance')
+
+
+def get_env_list(env):
+    """Distill an event environment to the list of "KEY=VALUE" strings that 
+    EmitEvent takes. A list (or tuple) is assumed to already be in that form.
+    """
+
+    if not env:
+        return _EMPTY_ENV_LIST
+    elif issubclass(env.__class__, (list, tuple)) is True:
+        return env
+
+    return [('%s=%s' % (k, v)) for (k, v) in env.items()]
+
 
 class UpstartSystem(object):
-    def __init__(self):
-        self.__system = dbus.SystemBus()
-        self.__o = self.__system.get_object(
-                    'com.ubuntu.Upstart', 
-                    '/com/ubuntu/Upstart')
+    def __init__(self, bus=None):
+        self.__bus = bus if bus is not None else get_bus()
 
-        self.__upstart_i = dbus.Interface(
-                                self.__o, 
-                                'com.ubuntu.Upstart0_6')
+        self.__upstart_i = self.__bus.get_interface(
+                                UPSTART_OBJECT_PATH, 
+                                UPSTART_INTERFACE)
 
-        self.__property_i = dbus.Interface(
-                                self.__o, 
-                                'org.freedesktop.DBus.Properties')
+        self.__property_i = self.__bus.get_interface(
+                                UPSTART_OBJECT_PATH, 
+                                PROPERTIES_INTERFACE)
 
     def get_version(self):
-        return self.__property_i.Get('com.ubuntu.Upstart0_6', 'version')
+        return self.__property_i.Get(
+                UPSTART_INTERFACE, 
+                'version', 
+                signature='ss')
 
     def get_log_priority(self):
-        return self.__property_i.Get('com.ubuntu.Upstart0_6', 'log_priority')
+        return self.__property_i.Get(
+                UPSTART_INTERFACE, 
+                'log_priority', 
+                signature='ss')
 
     def set_log_priority(self, priority_string):
         self.__property_i.Set(
-            'com.ubuntu.Upstart0_6', 
+            UPSTART_INTERFACE, 
             'log_priority', 
-            priority_string)
+            priority_string, 
+            signature='ssv')
+
+    def reload_configuration(self):
+        """Have Upstart reread its job configuration."""
+
+        self.__upstart_i.ReloadConfiguration(signature='')
 
     def get_all_jobs(self):
-        return (j[j.rfind('/') + 1:] for j in self.__upstart_i.GetAllJobs())
+        return (j[j.rfind('/') + 1:] 
+                for j 
+                in self.__upstart_i.GetAllJobs(signature=''))
+
+    def iter_all_job_statuses(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT, 
+                              native=False):
+        """Yield a (job name, list of instance statuses) tuple for every job, 
+        as each job's results arrive. The GetAllJobs, GetAllInstances, and 
+        GetAll calls are pipelined, with at most `max_in_flight` of them 
+        outstanding. Jobs without any active instances have an empty list.
+
+        If `native` is True, the statuses are JobStatus objects rather than 
+        D-Bus dictionaries.
+        """
+
+        pipeline = CallPipeline(bus=self.__bus, max_in_flight=max_in_flight)
+        completed = deque()
+
+        def ignore_vanished(e):
+            if e.get_dbus_name() not in _VANISHED_ERRORS:
+                raise e
+
+        def get_job(job_path):
+            job_name = job_path[job_path.rfind('/') + 1:]
+            statuses = []
+            waiting = [0]
+
+            def status_received(status):
+                if native is True:
+                    status = JobStatus.from_dbus(job_name, status)
+
+                statuses.append(status)
+                instance_done()
+
+            def status_failed(e):
+                instance_done()
+                ignore_vanished(e)
+
+            def instance_done():
+                waiting[0] -= 1
+                if waiting[0] == 0:
+                    completed.append((job_name, statuses))
+
+            def instances_received(instance_paths):
+                if not instance_paths:
+                    completed.append((job_name, statuses))
+                    return
+
+                waiting[0] = len(instance_paths)
+                for instance_path in instance_paths:
+                    properties_i = self.__bus.get_interface(
+                                    instance_path, 
+                                    PROPERTIES_INTERFACE)
+
+                    pipeline.submit(
+                        properties_i.GetAll, 
+                        ('',), 
+                        's', 
+                        reply_handler=status_received, 
+                        error_handler=status_failed)
+
+            job_i = self.__bus.get_interface(job_path, JOB_INTERFACE)
+            pipeline.submit(
+                job_i.GetAllInstances, 
+                (), 
+                '', 
+                reply_handler=instances_received, 
+                error_handler=ignore_vanished)
+
+        def jobs_received(job_paths):
+            for job_path in job_paths:
+                get_job(job_path)
+
+        pipeline.submit(
+            self.__upstart_i.GetAllJobs, 
+            (), 
+            '', 
+            reply_handler=jobs_received)
+
+        while pipeline.pending > 0 or completed:
+            while completed:
+                yield completed.popleft()
+
+            if pipeline.pending > 0:
+                pipeline.step()
+
+    def get_all_job_statuses(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT, 
+                             native=False):
+        """Return a dictionary of job names to lists of instance statuses, 
+        fetched in one pipelined batch.
+        """
+
+        return dict(self.iter_all_job_statuses(max_in_flight=max_in_flight, 
+                                               native=native))
 
     def emit(self, event_name, env={}, is_sync=True):
-        env_list_ = [('%s=%s' % (str(k), str(v))) for (k,v) in env.iteritems()]
-        self.__upstart_i.EmitEvent(event_name, env_list_, is_sync)
+        self.__upstart_i.EmitEvent(
+            event_name, 
+            get_env_list(env), 
+            is_sync, 
+            signature='sasb')
+
+    def emit_many(self, events, is_sync=True, 
+                  max_in_flight=DEFAULT_MAX_IN_FLIGHT, wait=True):
+        """Emit many events, pipelined, with at most `max_in_flight` 
+        outstanding at a time. `events` may be any iterable (e.g. a generator)
+        of event names and/or (event name, env) tuples.
+
+        Returns a list of (index, event name, error) tuples for the events 
+        that failed. If `wait` is False, return as soon as the last event is 
+        sent (fire-and-forget): failures for the replies that are still 
+        outstanding are appended to that list whenever the main-context is 
+        next iterated.
+        """
+
+        pipeline = CallPipeline(bus=self.__bus, max_in_flight=max_in_flight)
+        failures = []
+
+        def get_error_handler(i, event_name):
+            return lambda e: failures.append((i, event_name, e))
+
+        for i, event in enumerate(events):
+            if issubclass(event.__class__, tuple) is True:
+                (event_name, env) = event
+            else:
+                (event_name, env) = (event, None)
+
+            # Don't let the backlog grow beyond the in-flight limit.
+            pipeline.throttle()
+
+            pipeline.submit(
+                self.__upstart_i.EmitEvent, 
+                (event_name, get_env_list(env), is_sync), 
+                'sasb', 
+                error_handler=get_error_handler(i, event_name))
+
+        if wait is True:
+            pipeline.wait()
 
+        return failures